@@ -0,0 +1,261 @@
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Every in-memory cache created in the process, so they can be dropped at once
+CACHES = []
+
+
+def content_key(*parts):
+    """
+    Build a content-addressed key from the given parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode('utf-8')
+        digest.update(part)
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def clear_all():
+    for cache in CACHES:
+        cache.clear()
+
+
+class Cache:
+    """
+    Thread-safe wrapper around a cachetools cache.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._lock = threading.Lock()
+        CACHES.append(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._cache.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            try:
+                self._cache[key] = value
+            except ValueError:
+                # Value is bigger than the whole cache: don't keep it
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
+
+
+class DiskCache:
+    """
+    Stores bytes values as files named after their (content-addressed) key.
+    When maxsize (in bytes) is set, the least recently used values are removed once the directory is bigger.
+    """
+
+    # Keys are locked by stripes, so the number of lock files is bounded
+    LOCK_STRIPES = 256
+    # Other processes write in the directory too: its size is read again at this interval, in seconds
+    SCAN_INTERVAL = 60
+    # Interval between two checks of a value claimed by another process, in seconds
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, directory, maxsize=None):
+        self.directory = directory
+        self.maxsize = maxsize
+        self._locks = os.path.join(directory, '.locks')
+        self._claims = os.path.join(directory, '.claims')
+        os.makedirs(self._locks, exist_ok=True)
+        os.makedirs(self._claims, exist_ok=True)
+        self._size = None
+        self._scanned_at = None
+        self._size_lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            return default
+        if self.maxsize:
+            # The modification time orders the values for eviction
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return content
+
+    def set(self, key, value):
+        # Write in a temporary file first so readers never see a partial value
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(value)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        if self.maxsize:
+            self._track(len(value))
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Lock a key across processes, e.g. while its value is being computed by a worker.
+        """
+        stripe = int(content_key(key)[:8], 16) % self.LOCK_STRIPES
+        with self._file_lock(str(stripe)):
+            yield
+
+    def claim(self, key, ttl):
+        """
+        Claim the computation of a key across processes, without holding a lock while it is computed.
+        Returns False while another process holds a claim younger than ttl seconds, claims are released with release().
+        """
+        path = os.path.join(self._claims, key)
+        with self.lock(key):
+            try:
+                if time.time() - os.stat(path).st_mtime < ttl:
+                    return False
+            except FileNotFoundError:
+                pass
+            with open(path, 'wb'):
+                pass
+            # Claims left by stopped processes expire
+            os.utime(path, None)
+            return True
+
+    def release(self, key):
+        try:
+            os.remove(os.path.join(self._claims, key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _file_lock(self, name):
+        with open(os.path.join(self._locks, name), 'wb') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _track(self, size):
+        with self._size_lock:
+            if self._size is None or time.monotonic() - self._scanned_at > self.SCAN_INTERVAL:
+                self._size = sum(entry[1] for entry in self._entries())
+                self._scanned_at = time.monotonic()
+            else:
+                self._size += size
+            if self._size <= self.maxsize:
+                return
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            # Lock and temporary files are hidden
+            if entry.name.startswith('.'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used values until the directory is below 90% of maxsize.
+        """
+        with self._file_lock('evict'):
+            entries = sorted(self._entries())
+            size = sum(entry[1] for entry in entries)
+            for _, file_size, path in entries:
+                if size <= self.maxsize * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+        with self._size_lock:
+            self._size = size
+            self._scanned_at = time.monotonic()
+
+
+class ExpiringCache:
+    """
+    Cache of values expiring after their own time-to-live.
+    Values are refreshed in the background when requested less than `refresh_ahead` seconds before they expire,
+    and expired values are still served for `stale` seconds while they are refreshed in the background.
+    """
+
+    def __init__(self, maxsize, stale=0, refresh_ahead=0, timer=time.monotonic):
+        self._cache = Cache(LRUCache(maxsize=maxsize))
+        self.stale = stale
+        self.refresh_ahead = refresh_ahead
+        self.timer = timer
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """
+        loader is called without argument and returns the value with its time-to-live in seconds.
+        """
+        entry = self._cache.get(key)
+        if entry is not None:
+            value, expires = entry
+            now = self.timer()
+            if now < expires - self.refresh_ahead:
+                return value
+            if now < expires + self.stale:
+                self._refresh(key, loader)
+                return value
+        return self._load(key, loader)
+
+    def _load(self, key, loader):
+        value, ttl = loader()
+        if ttl > 0:
+            self._cache.set(key, (value, self.timer() + ttl))
+        return value
+
+    def _refresh(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh_task, args=(key, loader), daemon=True).start()
+
+    def _refresh_task(self, key, loader):
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            logger.error(e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self):
+        self._cache.clear()
@@ -0,0 +1,55 @@
+import itertools
+import os
+import threading
+
+# Keep-alive pings keep the HTTP/2 connections of the gRPC channels warm between requests,
+# and detect dead connections before a request is sent on them
+KEEPALIVE_TIME_MS = int(os.environ.get('GRPC_KEEPALIVE_TIME_MS', '30000'))
+KEEPALIVE_TIMEOUT_MS = int(os.environ.get('GRPC_KEEPALIVE_TIMEOUT_MS', '10000'))
+KEEPALIVE_PERMIT_WITHOUT_CALLS = int(os.environ.get('GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS', '1'))
+
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', KEEPALIVE_TIME_MS),
+    ('grpc.keepalive_timeout_ms', KEEPALIVE_TIMEOUT_MS),
+    ('grpc.keepalive_permit_without_calls', KEEPALIVE_PERMIT_WITHOUT_CALLS),
+    ('grpc.http2.max_pings_without_data', 0),
+]
+
+
+def create_channel(target, scopes=None):
+    """
+    Build an authenticated gRPC channel to target with the keep-alive options.
+    Channels must be built by the process using them: they don't survive a fork.
+    """
+    import google.auth
+    from google.auth.transport.grpc import secure_authorized_channel
+    from google.auth.transport.requests import Request
+    credentials, _ = google.auth.default(scopes=scopes)
+    return secure_authorized_channel(credentials, Request(), target, options=CHANNEL_OPTIONS)
+
+
+class ClientPool:
+    """
+    Round-robin over clients having their own channel to target, so concurrent calls are spread over several connections.
+    The channels are owned by the pool: they are closed when it is dropped, e.g. by providers.reset().
+    """
+
+    def __init__(self, create_client, target, scopes=None, size=1):
+        self.channels = [create_channel(target, scopes) for _ in range(max(size, 1))]
+        self.clients = [create_client(channel) for channel in self.channels]
+        self._clients = itertools.cycle(self.clients)
+        self._lock = threading.Lock()
+
+    def get(self):
+        if len(self.clients) == 1:
+            return self.clients[0]
+        with self._lock:
+            return next(self._clients)
+
+    def connect(self, timeout):
+        """
+        Wait for the channels to be connected, channels are otherwise only connected by their first call.
+        """
+        import grpc
+        for channel in self.channels:
+            grpc.channel_ready_future(channel).result(timeout=timeout)
@@ -1,5 +1,6 @@
 import pytest
 
+from api.cache import clear_all
 from api.server import app as flask_app
 
 
@@ -11,3 +12,10 @@ def app():
 @pytest.fixture()
 def client(app):
     return app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    clear_all()
+    yield
+    clear_all()
@@ -22,3 +22,72 @@ CUSTOM_MESSAGES = {
     "no-weather": "Sorry, I can't fouund the weather for this location."
 }
 }
+
+# Utterances answered without calling Recast, by language: words must match exactly (case and punctuation ignored),
+# slots match a value of their vocabulary
+FAST_INTENT_PATTERNS = {
+    "fr": [
+        ("news", "news"),
+        ("news", "les news"),
+        ("news", "actualités"),
+        ("news", "les actualités"),
+        ("news", "quelles sont les actualités"),
+        ("news", "quelles sont les news"),
+        ("cryptonews", "{cryptomonnaie}"),
+        ("cryptonews", "prix du {cryptomonnaie}"),
+        ("cryptonews", "cours du {cryptomonnaie}"),
+        ("cryptonews", "combien vaut le {cryptomonnaie}"),
+        ("cryptonews", "prix du {cryptomonnaie} et du {cryptomonnaie}"),
+        ("get-weather", "météo {location}"),
+        ("get-weather", "météo à {location}"),
+        ("get-weather", "la météo à {location}"),
+        ("get-weather", "quelle est la météo à {location}"),
+        ("get-weather", "quel temps fait il à {location}")
+    ],
+    "en": [
+        ("news", "news"),
+        ("news", "the news"),
+        ("news", "what are the news"),
+        ("news", "what's the news"),
+        ("cryptonews", "{cryptomonnaie}"),
+        ("cryptonews", "{cryptomonnaie} price"),
+        ("cryptonews", "price of {cryptomonnaie}"),
+        ("cryptonews", "how much is {cryptomonnaie}"),
+        ("cryptonews", "{cryptomonnaie} and {cryptomonnaie} price"),
+        ("get-weather", "weather {location}"),
+        ("get-weather", "weather in {location}"),
+        ("get-weather", "the weather in {location}"),
+        ("get-weather", "what's the weather in {location}"),
+        ("get-weather", "what is the weather in {location}")
+    ]
+}
+
+# Values of the slots, by name as written in the utterance
+CRYPTOCURRENCIES = {
+    "bitcoin": "bitcoin",
+    "btc": "bitcoin",
+    "ethereum": "ethereum",
+    "ether": "ethereum",
+    "eth": "ethereum",
+    "litecoin": "litecoin",
+    "ripple": "ripple",
+    "xrp": "ripple",
+    "dogecoin": "dogecoin"
+}
+
+CITIES = {
+    "paris": {"formatted": "Paris, France", "lat": 48.856614, "lng": 2.3522219},
+    "marseille": {"formatted": "Marseille, France", "lat": 43.296482, "lng": 5.36978},
+    "lyon": {"formatted": "Lyon, France", "lat": 45.764043, "lng": 4.835659},
+    "toulouse": {"formatted": "Toulouse, France", "lat": 43.604652, "lng": 1.444209},
+    "nice": {"formatted": "Nice, France", "lat": 43.710173, "lng": 7.261953},
+    "nantes": {"formatted": "Nantes, France", "lat": 47.218371, "lng": -1.553621},
+    "strasbourg": {"formatted": "Strasbourg, France", "lat": 48.573405, "lng": 7.752111},
+    "montpellier": {"formatted": "Montpellier, France", "lat": 43.610769, "lng": 3.876716},
+    "bordeaux": {"formatted": "Bordeaux, France", "lat": 44.837789, "lng": -0.57918},
+    "lille": {"formatted": "Lille, France", "lat": 50.62925, "lng": 3.057256},
+    "london": {"formatted": "London, UK", "lat": 51.507351, "lng": -0.127758},
+    "londres": {"formatted": "London, UK", "lat": 51.507351, "lng": -0.127758},
+    "new york": {"formatted": "New York, NY, USA", "lat": 40.712775, "lng": -74.005973},
+    "san francisco": {"formatted": "San Francisco, CA, USA", "lat": 37.774929, "lng": -122.419416}
+}
@@ -1,9 +1,19 @@
 import json
+import logging
 import os
+import threading
+from functools import lru_cache
 
-import requests
-
+import api.text_to_speech.ibm.helpers as tts
+from api import providers
+from api.cache import Cache, ExpiringCache
+from api.concurrency import SingleFlight
 from api.exceptions import APIException, ExternalAPIException
+from api.session import session, response_ttl
+from api.speech_to_text.google.constants import LANGUAGES_CODE, SIMPLIFIED_LANGUAGES_CODE
+from .constants import CUSTOM_MESSAGES
+
+logger = logging.getLogger(__name__)
 
 services_url = os.environ.get('SERVICES_URL')
 if services_url is None:
@@ -11,11 +21,48 @@ if services_url is None:
 
 headers = {'Content-Type': 'application/json'}
 
+# Audio of the CUSTOM_MESSAGES, by (language, message)
+fallback_audio = Cache({})
+# Longest wait for IBM while rendering each custom message, in seconds
+FALLBACK_AUDIO_TIMEOUT = float(os.environ.get('FALLBACK_AUDIO_TIMEOUT', '5'))
+
+# Coordinates are rounded to this number of decimals (about 1km) to cache their timezone
+TIMEZONE_PRECISION = int(os.environ.get('TIMEZONE_PRECISION', '2'))
+TIMEZONE_CACHE_SIZE = int(os.environ.get('TIMEZONE_CACHE_SIZE', '4096'))
+
+# Weather is cached by area (rounded coordinates), period of time and language
+WEATHER_PRECISION = int(os.environ.get('WEATHER_PRECISION', '2'))
+WEATHER_TIME_BUCKET = int(os.environ.get('WEATHER_TIME_BUCKET', '3600'))
+WEATHER_CACHE_TTL = int(os.environ.get('WEATHER_CACHE_TTL', '600'))
+WEATHER_CACHE_STALE = int(os.environ.get('WEATHER_CACHE_STALE', '300'))
+WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', '1024'))
+
+weather_cache = ExpiringCache(maxsize=WEATHER_CACHE_SIZE, stale=WEATHER_CACHE_STALE)
+
+# Crypto and news responses are cached according to their caching headers, or these defaults (in seconds)
+CRYPTO_CACHE_TTL = int(os.environ.get('CRYPTO_CACHE_TTL', '60'))
+NEWS_CACHE_TTL = int(os.environ.get('NEWS_CACHE_TTL', '300'))
+NOT_FOUND_CACHE_TTL = int(os.environ.get('NOT_FOUND_CACHE_TTL', '60'))
+SERVICES_CACHE_REFRESH_AHEAD = int(os.environ.get('SERVICES_CACHE_REFRESH_AHEAD', '10'))
+SERVICES_CACHE_SIZE = int(os.environ.get('SERVICES_CACHE_SIZE', '256'))
+
+services_cache = ExpiringCache(maxsize=SERVICES_CACHE_SIZE, refresh_ahead=SERVICES_CACHE_REFRESH_AHEAD)
+# Concurrent identical requests to the services API share a single call
+services_flight = SingleFlight()
+
 
 def get_weather(latitude, longitude, time, language):
+    key = (round(latitude, WEATHER_PRECISION), round(longitude, WEATHER_PRECISION), time // WEATHER_TIME_BUCKET, language)
+    return weather_cache.get_or_load(key, lambda: (
+        services_flight.do(('weather',) + key, request_weather, latitude, longitude, time, language),
+        WEATHER_CACHE_TTL
+    ))
+
+
+def request_weather(latitude, longitude, time, language):
     data = {'latitude': latitude, 'longitude': longitude, 'time': time, 'language': language}
     data = json.dumps(data)
-    res = requests.post(url=services_url+'/api/weather/', data=data, headers=headers)
+    res = session.post(url=services_url+'/api/weather/', data=data, headers=headers)
     if res.status_code == 200:
         return res.json()
     else:
@@ -23,18 +70,70 @@ def get_weather(latitude, longitude, time, language):
 
 
 def get_crypto(crypto):
-    res = requests.get(url=services_url+'/api/crypto/'+crypto, headers=headers)
+    key = ('crypto', crypto)
+    return services_cache.get_or_load(key, lambda: services_flight.do(key, request_crypto, crypto))
+
+
+def request_crypto(crypto):
+    res = session.get(url=services_url+'/api/crypto/'+crypto, headers=headers)
     if res.status_code == 200:
-        return res.json(), True
+        return (res.json(), True), response_ttl(res, CRYPTO_CACHE_TTL)
     elif res.status_code == 404:
-        return res.json(), False
+        return (res.json(), False), response_ttl(res, NOT_FOUND_CACHE_TTL)
     else:
         raise ExternalAPIException(api_name='API Services - Cryptonews', description='HTTP code: {}\nDetails: {}'.format(res.status_code, res.content))
 
 
 def get_news():
-    res = requests.get(url=services_url+'/api/news', headers=headers)
+    key = ('news',)
+    return services_cache.get_or_load(key, lambda: services_flight.do(key, request_news))
+
+
+def request_news():
+    res = session.get(url=services_url+'/api/news', headers=headers)
     if res.status_code == 200:
-        return res.json()
+        return res.json(), response_ttl(res, NEWS_CACHE_TTL)
     else:
         raise ExternalAPIException(api_name='API Services - Cryptonews', description='HTTP code: {}\nDetails: {}'.format(res.status_code, res.content))
+
+
+def create_timezone_finder():
+    """
+    TimezoneFinder loads its polygons when built: only one is built per process, with the first lookup.
+    """
+    import timezonefinder
+    return timezonefinder.TimezoneFinder()
+
+
+providers.register('timezone_finder', create_timezone_finder)
+
+
+@lru_cache(maxsize=TIMEZONE_CACHE_SIZE)
+def find_timezone(latitude, longitude):
+    return providers.get('timezone_finder').timezone_at(lng=longitude, lat=latitude)
+
+
+def get_timezone(latitude, longitude):
+    return find_timezone(round(latitude, TIMEZONE_PRECISION), round(longitude, TIMEZONE_PRECISION))
+
+
+def render_custom_messages(timeout=FALLBACK_AUDIO_TIMEOUT):
+    """
+    Synthesize every custom message once per language, so failed turns are answered without calling IBM.
+    """
+    for language in LANGUAGES_CODE:
+        for message in CUSTOM_MESSAGES[SIMPLIFIED_LANGUAGES_CODE[language]].values():
+            try:
+                fallback_audio.set((language, message), tts.ibm_send_request(message, language, timeout=timeout))
+            except Exception as e:
+                logger.error(e)
+
+
+def render_custom_messages_in_background():
+    """
+    Render the custom messages without blocking the caller, e.g. the boot of a worker.
+    Messages not rendered yet are synthesized when they are answered.
+    """
+    thread = threading.Thread(target=render_custom_messages, daemon=True)
+    thread.start()
+    return thread
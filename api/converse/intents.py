@@ -0,0 +1,111 @@
+import os
+import time as t
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+import dateutil.parser as dp
+from dateutil import tz
+
+from api.exceptions import ExternalAPIException
+from .constants import CUSTOM_MESSAGES
+from .helpers import get_weather, get_crypto, get_news, get_timezone
+
+# Longest wait for the answer of a special intent, in seconds
+INTENT_TIMEOUT = float(os.environ.get('INTENT_TIMEOUT', '10'))
+# Entities answered at the same time by each worker, e.g. the weather of several locations
+INTENT_CONCURRENCY = int(os.environ.get('INTENT_CONCURRENCY', '16'))
+
+# answer is called with an entity, the NLP results and the language, and returns the message for this entity.
+# entities returns the entities of the NLP results to answer, or is None if the intent doesn't need any.
+Handler = namedtuple('Handler', ['answer', 'entities', 'timeout'])
+
+HANDLERS = {}
+intent_pool = ThreadPoolExecutor(max_workers=INTENT_CONCURRENCY)
+
+
+def special_intent(intent, entities=None, timeout=None):
+    """
+    Register the decorated function as the answer of an intent, timeout defaults to INTENT_TIMEOUT.
+    """
+    def decorator(answer):
+        HANDLERS[intent] = Handler(answer, entities, timeout)
+        return answer
+    return decorator
+
+
+def check_special_intent(intent, res_nlp, language, started=None):
+    """
+    Answer an intent with its registered handler, or return None if it has none.
+    Entities are answered concurrently and their messages are joined in order.
+    started is the time.monotonic() of a previous attempt to answer the request, the attempts then share the timeout.
+    """
+    handler = HANDLERS.get(intent)
+    if handler is None:
+        return None
+    entities = handler.entities(res_nlp) if handler.entities else [None]
+    if not entities:
+        return None
+
+    futures = [intent_pool.submit(handler.answer, entity, res_nlp, language) for entity in entities]
+    timeout = handler.timeout if handler.timeout is not None else INTENT_TIMEOUT
+    if started is not None:
+        timeout = max(timeout - (t.monotonic() - started), 0)
+    done, not_done = wait(futures, timeout=timeout)
+    if not_done:
+        raise ExternalAPIException(api_name='API Services', description='{} timed out'.format(intent))
+    messages = [future.result() for future in futures]
+    return ' '.join(message for message in messages if message) or None
+
+
+def get_locations(res_nlp):
+    locations = res_nlp['nlp']['entities'].get('location')
+    if locations:
+        return locations
+    location = res_nlp['conversation']['memory'].get('weather-location')
+    return [location] if location else []
+
+
+@special_intent('get-weather', entities=get_locations)
+def answer_weather(location, res_nlp, language):
+    latitude = location['lat']
+    longitude = location['lng']
+    if not latitude and not longitude:
+        return CUSTOM_MESSAGES[language]['no-weather']
+    if res_nlp['nlp']['entities'].get('datetime'):
+        time = int(dp.parse(res_nlp['nlp']['entities']['datetime'][0]['iso']).strftime('%s'))
+    else:
+        time = int(t.time())
+    print('{}, {}, {}, {}'.format(latitude, longitude, time, language))
+    res = get_weather(latitude, longitude, time, language)
+    current_tz = tz.gettz(get_timezone(latitude, longitude))
+    local_time = datetime.fromtimestamp(time).replace(tzinfo=current_tz)
+    if language == 'fr':
+        message = 'La météo pour {} le {}: {} avec une temperature de {} °C et une probabilité de précipitation de {}%'
+    else:
+        message = 'The weather for {} at {}: {} with a temperature of {} °C with a probability of raining of {}%'
+    return message.format(
+            location['formatted'], local_time.strftime("%d/%m/%Y à %Hh%M"),
+            res['currently']['summary'], res['currently']['temperature'], res['currently']['precipProbability'])
+
+
+def get_cryptos(res_nlp):
+    return [entity['value'] for entity in res_nlp['nlp']['entities'].get('cryptomonnaie') or []]
+
+
+@special_intent('cryptonews', entities=get_cryptos)
+def answer_crypto(crypto, res_nlp, language):
+    print(crypto)
+    res, found = get_crypto(crypto)
+    if not found:
+        return CUSTOM_MESSAGES[language]['resource-not-found']
+    if language == 'fr':
+        message = 'La cryptomonnaie {0} vaut actuellement {1:.2f} € et a évolué de {2:.2f} % depuis les dernières 24h.'
+    else:
+        message = 'The cryptocurrency {0} is actually at {1:.2f} € and changed of {2:.2f} % during the last 24 hours.'
+    return message.format(crypto, res['value'], res['evolution'])
+
+
+@special_intent('news')
+def answer_news(entity, res_nlp, language):
+    return get_news()['message']
@@ -0,0 +1,127 @@
+import os
+import re
+from collections import namedtuple
+
+from .constants import FAST_INTENT_PATTERNS, CRYPTOCURRENCIES, CITIES
+
+# Set to 0 to send every utterance to Recast
+FAST_INTENTS = os.environ.get('FAST_INTENTS', '1').lower() in ('1', 'true')
+
+SLOT_REGEX = re.compile(r'^\{(\w+)\}$')
+
+# entities has the same format as the entities found by Recast
+Match = namedtuple('Match', ['intent', 'entities'])
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+class Node:
+    def __init__(self):
+        self.children = {}
+        # Slot name -> node following the slot
+        self.slots = {}
+        self.value = None
+
+
+class Vocabulary:
+    """
+    Trie of the values of a slot, which may be several words long.
+    """
+
+    def __init__(self, values):
+        self.root = Node()
+        for name, value in values.items():
+            node = self.root
+            for token in tokenize(name):
+                node = node.children.setdefault(token, Node())
+            node.value = value
+
+    def prefixes(self, tokens, start):
+        """
+        Values matching the tokens from start, with the position following them, longest first.
+        """
+        found = []
+        node = self.root
+        for position in range(start, len(tokens)):
+            node = node.children.get(tokens[position])
+            if node is None:
+                break
+            if node.value is not None:
+                found.append((position + 1, node.value))
+        return reversed(found)
+
+
+class Matcher:
+    """
+    Match whole utterances against patterns such as 'weather in {location}', compiled into a trie of words.
+    """
+
+    def __init__(self, patterns, vocabularies):
+        self.root = Node()
+        self.vocabularies = vocabularies
+        for intent, pattern in patterns:
+            node = self.root
+            for token in pattern.split():
+                slot = SLOT_REGEX.match(token)
+                if slot:
+                    node = node.slots.setdefault(slot.group(1), Node())
+                else:
+                    for word in tokenize(token):
+                        node = node.children.setdefault(word, Node())
+            node.value = intent
+
+    def match(self, text):
+        """
+        Return the Match of the text, or None if it doesn't match any pattern.
+        """
+        return self._match(self.root, tokenize(text), 0, {})
+
+    def _match(self, node, tokens, position, entities):
+        if position == len(tokens):
+            return Match(node.value, entities) if node.value else None
+        child = node.children.get(tokens[position])
+        if child:
+            found = self._match(child, tokens, position + 1, entities)
+            if found:
+                return found
+        for slot, child in node.slots.items():
+            for end, value in self.vocabularies[slot].prefixes(tokens, position):
+                entity = dict(value, raw=' '.join(tokens[position:end]))
+                found = self._match(child, tokens, end, dict(entities, **{slot: entities.get(slot, []) + [entity]}))
+                if found:
+                    return found
+        return None
+
+
+VOCABULARIES = {
+    'cryptomonnaie': Vocabulary(dict((name, {'value': value}) for name, value in CRYPTOCURRENCIES.items())),
+    'location': Vocabulary(CITIES)
+}
+MATCHERS = dict((language, Matcher(patterns, VOCABULARIES)) for language, patterns in FAST_INTENT_PATTERNS.items())
+
+
+def match_intent(text, language):
+    """
+    Find the intent of the text locally, returns None if it must be analyzed by Recast.
+    """
+    if not FAST_INTENTS or not text or language not in MATCHERS:
+        return None
+    return MATCHERS[language].match(text)
+
+
+def match_results(match, text, language):
+    """
+    Results of a local match in the format of Recast's.
+    """
+    return {
+        'nlp': {
+            'source': text,
+            'intents': [{'slug': match.intent, 'confidence': 1.0}],
+            'entities': match.entities,
+            'language': language
+        },
+        'messages': [],
+        'conversation': {'memory': {}}
+    }
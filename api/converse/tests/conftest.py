@@ -1,6 +1,7 @@
 import pytest
 import io
 import os
+import wave
 
 
 @pytest.fixture()
@@ -212,3 +213,14 @@ def corrupted_audio():
     file = os.getcwd() + '/api/speech_to_text/tests/fixtures/corrupted.wav'
     with io.open(file, 'rb') as audio:
         return audio.read()
+
+
+@pytest.fixture()
+def silent_audio():
+    content = io.BytesIO()
+    with wave.open(content, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(44100)
+        wav.writeframes(b'\x00\x00' * 44100)
+    return content.getvalue()
@@ -1,13 +1,19 @@
+import threading
+
 import pytest
-import requests
 from mock import patch, Mock
 
-from api.converse.helpers import get_crypto, get_news, get_weather
+from api import providers
+from api.converse.constants import CUSTOM_MESSAGES
+from api.converse.helpers import get_crypto, get_news, get_weather, render_custom_messages, fallback_audio, tts, \
+    get_timezone, find_timezone, render_custom_messages_in_background, FALLBACK_AUDIO_TIMEOUT
 from api.exceptions import ExternalAPIException, ResourceNotFoundException
+from api.session import session
+from api.speech_to_text.google.constants import LANGUAGES_CODE, SIMPLIFIED_LANGUAGES_CODE
 
 
 # Ensure that weather helper behaves correctly
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_weather_success(mock_post, converse_weather_request, converse_weather_response):
     mock_post.return_value = Mock(status_code=200, json=Mock(return_value=converse_weather_response))
     get_weather(latitude=converse_weather_request['latitude'], longitude=converse_weather_request['longitude'],
@@ -17,7 +23,7 @@ def test_weather_success(mock_post, converse_weather_request, converse_weather_r
 
 
 # Ensure that weather helper behaves correctly when service is offline
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_weather_fail(mock_post, converse_weather_request):
     mock_post.return_value = Mock(status_code=500)
     with pytest.raises(ExternalAPIException):
@@ -27,16 +33,16 @@ def test_weather_fail(mock_post, converse_weather_request):
 
 
 # Ensure that crypto helper behaves correctly
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_crypto_success(mock_get, converse_crypto_request, converse_crypto_response):
-    mock_get.return_value = Mock(status_code=200, json=Mock(return_value=converse_crypto_response))
+    mock_get.return_value = Mock(status_code=200, headers={}, json=Mock(return_value=converse_crypto_response))
     res, found = get_crypto(crypto=converse_crypto_request)
     assert found
     assert mock_get.call_count == 1
 
 
 # Ensure that crypto helper behaves correctly when service is offline
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_crypto_fail(mock_get, converse_crypto_request):
     mock_get.return_value = Mock(status_code=500)
     with pytest.raises(ExternalAPIException):
@@ -45,27 +51,127 @@ def test_crypto_fail(mock_get, converse_crypto_request):
 
 
 # Ensure that crypto helper behaves correctly when resource can't be found
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_crypto_not_found(mock_get):
-    mock_get.return_value = Mock(status_code=404)
+    mock_get.return_value = Mock(status_code=404, headers={})
     res, found = get_crypto(crypto='weird_crypto_name')
     assert not found
     assert mock_get.call_count == 1
 
 
 # Ensure that news helper behaves correctly
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_news_success(mock_get, converse_news_response):
-    mock_get.return_value = Mock(status_code=200, json=Mock(return_value=converse_news_response))
+    mock_get.return_value = Mock(status_code=200, headers={}, json=Mock(return_value=converse_news_response))
     get_news()
 
     assert mock_get.call_count == 1
 
 
 # Ensure that news helper behaves correctly when service is offline
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_news_fail(mock_get):
     mock_get.return_value = Mock(status_code=500)
     with pytest.raises(ExternalAPIException):
         get_news()
     assert mock_get.call_count == 1
+
+
+# Ensure that custom messages are rendered once per language
+@patch.object(tts, 'ibm_send_request', autospec=True)
+def test_render_custom_messages(mock_ibm_send_request):
+    mock_ibm_send_request.return_value = b'audio'
+    render_custom_messages()
+
+    expected_count = sum(len(CUSTOM_MESSAGES[SIMPLIFIED_LANGUAGES_CODE[language]]) for language in LANGUAGES_CODE)
+    assert mock_ibm_send_request.call_count == expected_count
+    assert fallback_audio.get(('fr-FR', CUSTOM_MESSAGES['fr']['not-heard'])) == b'audio'
+    # A slow IBM can't hold the rendering
+    assert all(call[1]['timeout'] == FALLBACK_AUDIO_TIMEOUT for call in mock_ibm_send_request.call_args_list)
+
+
+# Ensure that custom messages can be rendered without blocking
+@patch.object(tts, 'ibm_send_request', autospec=True)
+def test_render_custom_messages_in_background(mock_ibm_send_request):
+    release = threading.Event()
+    mock_ibm_send_request.side_effect = lambda message, language, timeout: release.wait(5) and b'audio'
+    thread = render_custom_messages_in_background()
+
+    assert thread.daemon
+    assert len(fallback_audio) == 0
+    release.set()
+    thread.join(5)
+    assert fallback_audio.get(('fr-FR', CUSTOM_MESSAGES['fr']['not-heard'])) == b'audio'
+
+
+# Ensure that a failed rendering doesn't prevent the others
+@patch.object(tts, 'ibm_send_request', autospec=True)
+def test_render_custom_messages_fail(mock_ibm_send_request):
+    mock_ibm_send_request.side_effect = ExternalAPIException(api_name='IBM')
+    render_custom_messages()
+
+    assert mock_ibm_send_request.call_count > 1
+    assert len(fallback_audio) == 0
+
+
+# Ensure that timezones are looked up once per area with a single finder
+@patch('timezonefinder.TimezoneFinder', autospec=True)
+def test_get_timezone(mock_timezone_finder):
+    mock_timezone_finder.return_value.timezone_at.return_value = 'Europe/Paris'
+    providers.reset('timezone_finder')
+    find_timezone.cache_clear()
+
+    assert get_timezone(48.856614, 2.3522219) == 'Europe/Paris'
+    assert get_timezone(48.857, 2.352) == 'Europe/Paris'
+    assert get_timezone(45.764043, 4.835659) == 'Europe/Paris'
+
+    assert mock_timezone_finder.call_count == 1
+    assert mock_timezone_finder.return_value.timezone_at.call_count == 2
+    providers.reset('timezone_finder')
+    find_timezone.cache_clear()
+
+
+# Ensure that weather is requested once per area, period of time and language
+@patch.object(session, 'post', autospec=True)
+def test_weather_cache(mock_post, converse_weather_request, converse_weather_response):
+    mock_post.return_value = Mock(status_code=200, json=Mock(return_value=converse_weather_response))
+    get_weather(latitude=48.856614, longitude=2.3522219, time=1530731661, language='fr')
+    res = get_weather(latitude=48.857, longitude=2.352, time=1530731700, language='fr')
+
+    assert res == converse_weather_response
+    assert mock_post.call_count == 1
+
+    get_weather(latitude=48.856614, longitude=2.3522219, time=1530731661, language='en')
+    get_weather(latitude=48.856614, longitude=2.3522219, time=1530731661 + 3600, language='fr')
+    assert mock_post.call_count == 3
+
+
+# Ensure that crypto and news are cached, including missing resources
+@patch.object(session, 'get', autospec=True)
+def test_services_cache(mock_get, converse_crypto_request, converse_crypto_response, converse_news_response):
+    mock_get.return_value = Mock(status_code=200, headers={}, json=Mock(return_value=converse_crypto_response))
+    get_crypto(crypto=converse_crypto_request)
+    res, found = get_crypto(crypto=converse_crypto_request)
+    assert found and res == converse_crypto_response
+    assert mock_get.call_count == 1
+
+    mock_get.return_value = Mock(status_code=404, headers={})
+    get_crypto(crypto='weird_crypto_name')
+    res, found = get_crypto(crypto='weird_crypto_name')
+    assert not found
+    assert mock_get.call_count == 2
+
+    mock_get.return_value = Mock(status_code=200, headers={}, json=Mock(return_value=converse_news_response))
+    get_news()
+    assert get_news() == converse_news_response
+    assert mock_get.call_count == 3
+
+
+# Ensure that services responses aren't cached when the service forbids it
+@patch.object(session, 'get', autospec=True)
+def test_services_cache_no_store(mock_get, converse_news_response):
+    mock_get.return_value = Mock(status_code=200, headers={'Cache-Control': 'no-store'},
+                                 json=Mock(return_value=converse_news_response))
+    get_news()
+    get_news()
+    assert mock_get.call_count == 2
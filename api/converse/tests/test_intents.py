@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+from mock import patch
+
+from api.converse.constants import CUSTOM_MESSAGES
+from api.converse.intents import check_special_intent, special_intent, HANDLERS, INTENT_TIMEOUT
+from api.exceptions import ExternalAPIException
+
+
+def nlp_results(entities, memory=None):
+    return {'nlp': {'entities': entities}, 'conversation': {'memory': memory or {}}}
+
+
+# Ensure that the weather of several locations is requested concurrently and answered in order
+@patch('api.converse.intents.get_timezone', autospec=True, return_value='Europe/Paris')
+@patch('api.converse.intents.get_weather', autospec=True)
+def test_check_special_intent_weather(mock_get_weather, mock_get_timezone, converse_weather_response):
+    # Both locations must be requested at the same time to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def side_effect(latitude, longitude, time_, language):
+        barrier.wait()
+        return converse_weather_response
+
+    mock_get_weather.side_effect = side_effect
+    locations = [
+        {'formatted': 'Paris, France', 'lat': 48.856614, 'lng': 2.3522219},
+        {'formatted': 'Lyon, France', 'lat': 45.764043, 'lng': 4.835659}
+    ]
+    message = check_special_intent('get-weather', nlp_results({'location': locations}), 'fr')
+
+    assert mock_get_weather.call_count == 2
+    assert message.index('Paris, France') < message.index('Lyon, France')
+
+    # The location in memory is used when none is given
+    mock_get_weather.side_effect = None
+    mock_get_weather.return_value = converse_weather_response
+    message = check_special_intent('get-weather', nlp_results({}, {'weather-location': locations[1]}), 'en')
+    assert 'Lyon, France' in message
+    assert check_special_intent('get-weather', nlp_results({}), 'en') is None
+
+
+# Ensure that every crypto is answered
+@patch('api.converse.intents.get_crypto', autospec=True)
+def test_check_special_intent_crypto(mock_get_crypto, converse_crypto_response):
+    mock_get_crypto.side_effect = lambda crypto: (converse_crypto_response, crypto == 'ethereum')
+    entities = {'cryptomonnaie': [{'value': 'ethereum'}, {'value': 'unknown'}]}
+    message = check_special_intent('cryptonews', nlp_results(entities), 'en')
+
+    assert message.startswith('The cryptocurrency ethereum is actually at 381.97 €')
+    assert message.endswith(CUSTOM_MESSAGES['en']['resource-not-found'])
+    assert check_special_intent('cryptonews', nlp_results({}), 'en') is None
+
+
+# Ensure that intents without handler aren't answered
+def test_check_special_intent_unknown():
+    assert check_special_intent('greetings', nlp_results({}), 'en') is None
+
+
+# Ensure that handlers are registered and fail when they are too slow, their late answer being ignored
+@patch('api.converse.intents.INTENT_TIMEOUT', 0.01)
+def test_special_intent_timeout():
+    release = threading.Event()
+    answered = threading.Event()
+
+    @special_intent('test-slow')
+    def answer_slow(entity, res_nlp, language):
+        release.wait(5)
+        answered.set()
+        return 'too late'
+
+    try:
+        assert HANDLERS['test-slow'].answer is answer_slow
+        with pytest.raises(ExternalAPIException):
+            check_special_intent('test-slow', nlp_results({}), 'en')
+        assert not answered.is_set()
+    finally:
+        release.set()
+        del HANDLERS['test-slow']
+
+
+# Ensure that a second attempt to answer a request only waits for the rest of the timeout of the first one
+def test_special_intent_timeout_shared():
+    release = threading.Event()
+
+    @special_intent('test-slow')
+    def answer_slow(entity, res_nlp, language):
+        release.wait(5)
+        return 'too late'
+
+    try:
+        with pytest.raises(ExternalAPIException):
+            check_special_intent('test-slow', nlp_results({}), 'en', started=time.monotonic() - INTENT_TIMEOUT)
+    finally:
+        release.set()
+        del HANDLERS['test-slow']
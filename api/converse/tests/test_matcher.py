@@ -0,0 +1,53 @@
+from mock import patch
+
+from api.converse.matcher import Matcher, Vocabulary, match_intent, match_results
+
+
+# Ensure that whole utterances are matched with their slots
+def test_match_intent():
+    match = match_intent('Quelle est la météo à Paris ?', 'fr')
+    assert match.intent == 'get-weather'
+    assert match.entities['location'][0]['formatted'] == 'Paris, France'
+    assert match.entities['location'][0]['raw'] == 'paris'
+
+    match = match_intent("What's the weather in New York", 'en')
+    assert match.entities['location'][0]['lat'] == 40.712775
+
+    match = match_intent('BTC and ether price', 'en')
+    assert match.intent == 'cryptonews'
+    assert [entity['value'] for entity in match.entities['cryptomonnaie']] == ['bitcoin', 'ethereum']
+
+    assert match_intent('news', 'en') == ('news', {})
+
+
+# Ensure that other utterances are left to Recast
+def test_match_intent_no_match():
+    assert match_intent('Salut', 'fr') is None
+    assert match_intent('weather in Atlantis', 'en') is None
+    assert match_intent('what are the news today', 'en') is None
+    assert match_intent('news', 'de') is None
+    assert match_intent('', 'en') is None
+    with patch('api.converse.matcher.FAST_INTENTS', False):
+        assert match_intent('news', 'en') is None
+
+
+# Ensure that words are tried before slots, longest slot values first, and the others when the pattern doesn't match
+def test_matcher_backtracking():
+    vocabularies = {'city': Vocabulary({'york': {'id': 1}, 'new york': {'id': 2}})}
+
+    matcher = Matcher([('a', '{city}'), ('b', 'new {city}')], vocabularies)
+    assert matcher.match('new york') == ('b', {'city': [{'id': 1, 'raw': 'york'}]})
+    assert matcher.match('york') == ('a', {'city': [{'id': 1, 'raw': 'york'}]})
+
+    matcher = Matcher([('a', '{city}'), ('b', 'old {city}')], vocabularies)
+    assert matcher.match('new york') == ('a', {'city': [{'id': 2, 'raw': 'new york'}]})
+    matcher = Matcher([('a', '{city} now'), ('b', 'new york later')], vocabularies)
+    assert matcher.match('new york now') == ('a', {'city': [{'id': 2, 'raw': 'new york'}]})
+
+
+# Ensure that local matches look like Recast results
+def test_match_results():
+    results = match_results(match_intent('news', 'en'), 'news', 'en')
+
+    assert results['nlp']['intents'][0]['slug'] == 'news'
+    assert results['conversation']['memory'] == {}
@@ -1,16 +1,17 @@
 import pytest
 import json
 
-import requests
 from mock import patch, MagicMock, Mock
 from flask import url_for
 import io
+from google.cloud.speech import SpeechClient
 from api.exceptions import BadParameterException, MissingParameterException, InvalidCredentialsException, \
     ExternalAPIException, APIException, BadHeaderException, MissingHeaderException, OperationFailedException
-from api.converse.views import get_crypto, get_news, get_weather
 from api.converse.constants import AUDIO_FORMATS, SUPPORTED_FORMATS, TEXT_FORMATS, CUSTOM_MESSAGES, DEFAULT_INTENT
 from api.converse.views import nlp, tts, stt
+from api.converse.helpers import render_custom_messages
 from api.speech_to_text.google.constants import LANGUAGES_CODE, SIMPLIFIED_LANGUAGES_CODE
+from api.session import session
 
 
 # Ensure that Converse behaves correctly when provided correct information
@@ -104,11 +105,28 @@ def test_converse_audio_to_audio_success(mock_check_special_intent, mock_recast_
     assert mock_check_special_intent.call_count == 1
 
 
+# Ensure that Converse rejects invalid audio without calling Google
+@patch.object(stt, 'get_speech_client', autospec=True)
+def test_converse_invalid_audio(mock_get_speech_client, client, converse_audio_request, corrupted_audio):
+    res = client.post(
+        url_for('converse.conversation-text'),
+        content_type='multipart/form-data',
+        data={
+            'audio': (io.BytesIO(corrupted_audio), 'audio.wav'),
+            'language': converse_audio_request['language'],
+            'user_id': converse_audio_request['user_id']
+        }
+    )
+    assert res.status_code == BadParameterException.status_code
+    assert json.loads(res.data)['errors'][0]['code'] == 'bad_parameter'
+    assert mock_get_speech_client.call_count == 0
+
+
 # Ensure that special intents work correctly
 @patch.object(nlp, 'recast_send_request_dialog', autospec=True)
-@patch('api.converse.views.get_weather', autospec=True)
-@patch('api.converse.views.get_crypto', autospec=True)
-@patch('api.converse.views.get_news', autospec=True)
+@patch('api.converse.intents.get_weather', autospec=True)
+@patch('api.converse.intents.get_crypto', autospec=True)
+@patch('api.converse.intents.get_news', autospec=True)
 def test_converse_special_intent_weather(mock_get_news, mock_get_crypto, mock_get_weather,
                                          mock_recast_send_request_dialog, client,
                                          converse_text_request, recast_answer_response, converse_weather_response,
@@ -178,6 +196,56 @@ def test_converse_special_intent_weather(mock_get_news, mock_get_crypto, mock_ge
     assert mock_recast_send_request_dialog.call_count == 3
 
 
+# Ensure that common commands are answered without calling Recast
+@patch.object(nlp, 'recast_send_request_dialog', autospec=True)
+@patch('api.converse.intents.get_news', autospec=True)
+def test_converse_fast_intent(mock_get_news, mock_recast_send_request_dialog, client, converse_text_request,
+                              converse_news_response, recast_answer_response):
+    mock_get_news.return_value = converse_news_response
+    converse_text_request['text'] = 'Quelles sont les news ?'
+    res = client.post(
+        url_for('converse.conversation-text'),
+        content_type='application/json',
+        data=json.dumps(converse_text_request)
+    )
+    dict_res = json.loads(res.data)
+
+    assert res.status_code == 200
+    assert dict_res['intent'] == 'news'
+    assert dict_res['message'] == converse_news_response['message']
+    assert mock_recast_send_request_dialog.call_count == 0
+
+    # Recast answers when the command fails locally
+    mock_get_news.side_effect = ExternalAPIException()
+    mock_recast_send_request_dialog.return_value = recast_answer_response
+    res = client.post(
+        url_for('converse.conversation-text'),
+        content_type='application/json',
+        data=json.dumps(converse_text_request)
+    )
+    assert res.status_code == 200
+    assert mock_recast_send_request_dialog.call_count == 1
+
+
+# Ensure that a command failing locally doesn't get a new timeout when Recast answers it
+@patch.object(nlp, 'recast_send_request_dialog', autospec=True)
+@patch('api.converse.views.check_special_intent', autospec=True)
+def test_converse_fast_intent_shared_timeout(mock_check_special_intent, mock_recast_send_request_dialog, client,
+                                            converse_text_request, recast_answer_response):
+    mock_check_special_intent.side_effect = [ExternalAPIException(), None]
+    mock_recast_send_request_dialog.return_value = recast_answer_response
+    converse_text_request['text'] = 'Quelles sont les news ?'
+    res = client.post(
+        url_for('converse.conversation-text'),
+        content_type='application/json',
+        data=json.dumps(converse_text_request)
+    )
+
+    assert res.status_code == 200
+    assert mock_check_special_intent.call_count == 2
+    assert mock_check_special_intent.call_args[1]['started'] is not None
+
+
 # Ensure that Converse behaves correctly when language is missing
 @patch.object(nlp, 'recast_send_request_dialog', autospec=True)
 def test_converse_missing_language(mock_recast_send_request_dialog, client, converse_text_request,
@@ -325,6 +393,53 @@ def test_converse_stt_fail(mock_google_speech_send_request, mock_recast_send_req
     assert mock_recast_send_request_dialog.call_count == 0
 
 
+# Ensure that Converse answers silent audio without calling google speech
+@patch.object(nlp, 'recast_send_request_dialog', autospec=True)
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_converse_stt_silent(mock_recognize, mock_recast_send_request_dialog, client, converse_audio_request,
+                             silent_audio):
+    res = client.post(
+        url_for('converse.conversation-text'),
+        content_type='multipart/form-data',
+        data={
+            'audio': (io.BytesIO(silent_audio), 'audio.wav'),
+            'language': converse_audio_request['language'],
+            'user_id': converse_audio_request['user_id']
+        }
+    )
+    dict_res = json.loads(res.data)
+    assert res.status_code == 200
+    assert dict_res['message'] == CUSTOM_MESSAGES[SIMPLIFIED_LANGUAGES_CODE[converse_audio_request['language']]]["not-heard"]
+    assert mock_recognize.call_count == 0
+    assert mock_recast_send_request_dialog.call_count == 0
+
+
+# Ensure that Converse answers with the pre-rendered audio when google speech failed
+@patch.object(tts, 'ibm_send_request', autospec=True)
+@patch.object(nlp, 'recast_send_request_dialog', autospec=True)
+@patch.object(stt, 'google_speech_send_request', autospec=True)
+def test_converse_stt_fail_fallback_audio(mock_google_speech_send_request, mock_recast_send_request_dialog,
+                                          mock_ibm_send_request, client, converse_audio_request):
+    mock_google_speech_send_request.side_effect = OperationFailedException()
+    mock_ibm_send_request.return_value = b'audio'
+    render_custom_messages()
+    mock_ibm_send_request.reset_mock()
+
+    res = client.post(
+        url_for('converse.conversation-audio'),
+        content_type='multipart/form-data',
+        data={
+            'audio': (io.BytesIO(converse_audio_request['audio']), 'audio.wav'),
+            'language': converse_audio_request['language'],
+            'user_id': converse_audio_request['user_id']
+        }
+    )
+    assert res.status_code == 200
+    assert res.data == b'audio'
+    assert mock_recast_send_request_dialog.call_count == 0
+    assert mock_ibm_send_request.call_count == 0
+
+
 # Ensure that Converse behaves correctly when google speech stopped
 @patch.object(nlp, 'recast_send_request_dialog', autospec=True)
 @patch.object(stt, 'google_speech_send_request', autospec=True)
@@ -347,7 +462,7 @@ def test_converse_stt_stop(mock_google_speech_send_request, mock_recast_send_req
 
 
 # Ensure that Converse behaves correctly when recast credentials are invalid
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_converse_nlp_invalid_credentials(mock_post, client, converse_text_request):
     mock_post.return_value = Mock(status_code=401)
     res = client.post(
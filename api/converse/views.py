@@ -1,11 +1,7 @@
 import json
 import logging
-import time as t
-from datetime import datetime
+import time
 
-import dateutil.parser as dp
-import timezonefinder
-from dateutil import tz
 from flask import Blueprint, request, jsonify, Response
 
 import api.nlp.recast.helpers as nlp
@@ -16,7 +12,9 @@ from api.exceptions import MissingParameterException, InvalidCredentialsExceptio
     OperationFailedException
 from api.speech_to_text.google.constants import LANGUAGES_CODE, SIMPLIFIED_LANGUAGES_CODE
 from .constants import AUDIO_FORMATS, TEXT_FORMATS, SUPPORTED_FORMATS, DEFAULT_INTENT, CUSTOM_MESSAGES
-from .helpers import get_weather, get_crypto, get_news
+from .helpers import fallback_audio
+from .intents import check_special_intent
+from .matcher import match_intent, match_results
 
 converse = Blueprint('converse', __name__)
 logger = logging.getLogger(__name__)
@@ -32,6 +30,8 @@ def conversation(want):
     intent = None
     text = None
     language = None
+    stream = False
+    intent_started = None
     input_type, errors, code = check_request(request)
     if errors:
         return jsonify({'errors': errors}), code
@@ -41,6 +41,7 @@ def conversation(want):
             user_id = request.form['user_id']
         audio = request.files['audio']
         language = request.form['language']
+        stream = request.form.get('stream') in ('1', 'true')
         if language not in LANGUAGES_CODE:
             return jsonify({'errors': [dict(BadParameterException('language', valid_values=LANGUAGES_CODE))]}), BadParameterException.status_code
         try:
@@ -60,6 +61,8 @@ def conversation(want):
             message = CUSTOM_MESSAGES[SIMPLIFIED_LANGUAGES_CODE[language]]["not-heard"]
             intent = DEFAULT_INTENT
             skipping_nlp = True
+        except BadParameterException as e:
+            return jsonify({'errors': [dict(e)]}), e.status_code
         except Exception as e:
             logger.error(e)
             return jsonify({'errors': [dict(ExternalAPIException('Google'))]}), ExternalAPIException.status_code
@@ -69,10 +72,28 @@ def conversation(want):
         # print(user_id)
         text = request.json['text']
         language = request.json['language']
+        stream = bool(request.json.get('stream'))
 
         output['input'] = text
         if language not in LANGUAGES_CODE:
             return jsonify({'errors': [dict(BadParameterException('language', valid_values=LANGUAGES_CODE))]}), BadParameterException.status_code
+    if not skipping_nlp:
+        # Common commands are answered without waiting for Recast
+        match = match_intent(text, SIMPLIFIED_LANGUAGES_CODE[language])
+        if match:
+            res_nlp = {'results': match_results(match, text, SIMPLIFIED_LANGUAGES_CODE[language])}
+            intent_started = time.monotonic()
+            try:
+                spec_message = check_special_intent(match.intent, res_nlp['results'], SIMPLIFIED_LANGUAGES_CODE[language])
+            except Exception as e:
+                # Recast will try again
+                logger.error(e)
+                spec_message = None
+            if spec_message:
+                output['nlp'] = res_nlp
+                intent = match.intent
+                message = spec_message
+                skipping_nlp = True
     if not skipping_nlp:
         # Analyze the text
         try:
@@ -95,7 +116,9 @@ def conversation(want):
             return jsonify({'errors': [dict(APIException(code='nlp_error', msg=str(e)))]}), APIException.status_code
         # Check special intents
         try:
-            spec_message = check_special_intent(intent, res_nlp['results'], SIMPLIFIED_LANGUAGES_CODE[language])
+            # Answering a command which failed locally doesn't wait longer than the timeout of the first attempt
+            spec_message = check_special_intent(intent, res_nlp['results'], SIMPLIFIED_LANGUAGES_CODE[language],
+                                                started=intent_started)
             if spec_message:
                 message = spec_message
         except ExternalAPIException as e:
@@ -111,7 +134,9 @@ def conversation(want):
         return jsonify(output), 200
     elif want == 'audio':
         try:
-            res_tts = tts.ibm_send_request(message, language)
+            res_tts = fallback_audio.get((language, message))
+            if res_tts is None:
+                res_tts = tts.ibm_send_request(message, language, stream=stream)
         except (InvalidCredentialsException, ExternalAPIException) as e:
             return jsonify({'errors': [dict(e)]}), e.status_code
         except Exception as e:
@@ -127,52 +152,6 @@ def conversation(want):
         return jsonify({'errors': [dict(APIException(code='invalid_output_format_requested'))]}), APIException.status_code
 
 
-def check_special_intent(intent, res_nlp, language):
-    message = None
-    # Case: weather
-    if intent == "get-weather":
-        location = res_nlp['nlp']['entities'].get('location')[0] if res_nlp['nlp']['entities'].get('location') else res_nlp['conversation']['memory'].get('weather-location')
-        if location:
-            latitude = location['lat']
-            longitude = location['lng']
-            if not latitude and not longitude:
-                return CUSTOM_MESSAGES[language]['no-weather']
-            if res_nlp['nlp']['entities'].get('datetime'):
-                time = int(dp.parse(res_nlp['nlp']['entities']['datetime'][0]['iso']).strftime('%s'))
-            else:
-                time = int(t.time())
-            print('{}, {}, {}, {}'.format(latitude, longitude, time, language))
-            res = get_weather(latitude, longitude, time, language)
-            tf = timezonefinder.TimezoneFinder()
-            current_tz = tz.gettz(tf.timezone_at(lng=longitude, lat=latitude))
-            local_time = datetime.fromtimestamp(time).replace(tzinfo=current_tz)
-            if language == 'fr':
-                message = 'La météo pour {} le {}: {} avec une temperature de {} °C et une probabilité de précipitation de {}%'
-            else:
-                message = 'The weather for {} at {}: {} with a temperature of {} °C with a probability of raining of {}%'
-            message = message.format(
-                    location['formatted'], local_time.strftime("%d/%m/%Y à %Hh%M"),
-                    res['currently']['summary'], res['currently']['temperature'], res['currently']['precipProbability'])
-    if intent == "cryptonews":
-        if res_nlp['nlp']['entities'].get('cryptomonnaie'):
-            crypto = res_nlp['nlp']['entities']['cryptomonnaie'][0]['value']
-            print(crypto)
-            res, found = get_crypto(crypto)
-            if not found:
-                message = CUSTOM_MESSAGES[language]['resource-not-found']
-            else:
-                if language == 'fr':
-                    message = 'La cryptomonnaie {0} vaut actuellement {1:.2f} € et a évolué de {2:.2f} % depuis les dernières 24h.'
-                else:
-                    message = 'The cryptocurrency {0} is actually at {1:.2f} € and changed of {2:.2f} % during the last 24 hours.'
-                message = message.format(
-                        crypto, res['value'], res['evolution'])
-    if intent == "news":
-        res = get_news()
-        message = res['message']
-    return message
-
-
 def check_request(req):
     errors = []
     content_type = req.headers.get('Content-Type')
@@ -1,27 +1,69 @@
-import os
-import requests
 import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 from api.exceptions import ExternalAPIException, InvalidCredentialsException, OperationFailedException, ResourceNotFoundException
+from api import providers
+from api.cache import ExpiringCache
+from api.concurrency import SingleFlight
+from api.session import session
 from .constants import TEST_TEXT, DEFAULT_ID
+from .memory import MemoryStore
+
+logger = logging.getLogger(__name__)
+
+providers.register('recast_credentials', lambda: providers.load_credentials('recast'))
+
+# Intent classification is stateless: concurrent identical requests share a single call
+intent_flight = SingleFlight()
 
-with open(os.getcwd() + '/res/credentials/recast.json', 'r') as file:
-    RECAST_CREDENTIALS = json.load(file)
+# Intents only depend on the text, the language and the training of the bot
+INTENT_CACHE_TTL = int(os.environ.get('INTENT_CACHE_TTL', '3600'))
+INTENT_CACHE_SIZE = int(os.environ.get('INTENT_CACHE_SIZE', '4096'))
+# Changing it (e.g. when deploying after the bot is trained) invalidates the cached intents
+RECAST_BOT_VERSION = os.environ.get('RECAST_BOT_VERSION', '')
+# File shared by the workers, touched to invalidate the cached intents of all of them (empty to disable)
+INTENT_CACHE_STAMP = os.environ.get('INTENT_CACHE_STAMP',
+                                    os.path.join(tempfile.gettempdir(), 'surirobot-api-converse-intents.stamp'))
+intent_cache = ExpiringCache(maxsize=INTENT_CACHE_SIZE)
 
-token = RECAST_CREDENTIALS['token']
-headers = {'Authorization': 'Token ' + token, 'Content-Type': 'application/json'}
+# Texts of a batch classified at the same time, shared by every batch of the worker
+INTENT_BATCH_CONCURRENCY = int(os.environ.get('INTENT_BATCH_CONCURRENCY', '8'))
+intent_batch_pool = ThreadPoolExecutor(max_workers=INTENT_BATCH_CONCURRENCY)
+
+# Conversation memory is mirrored by each worker, changes are written to Recast in the background after this delay
+MEMORY_FLUSH_DELAY = float(os.environ.get('MEMORY_FLUSH_DELAY', '0.2'))
+# Time the memory of a user is served without being read again from Recast, in seconds
+MEMORY_TTL = float(os.environ.get('MEMORY_TTL', '60'))
+MEMORY_STORE_SIZE = int(os.environ.get('MEMORY_STORE_SIZE', '10000'))
+MEMORY_FLUSH_RETRIES = int(os.environ.get('MEMORY_FLUSH_RETRIES', '3'))
+
+
+def get_headers():
+    token = providers.get('recast_credentials')['token']
+    return {'Authorization': 'Token ' + token, 'Content-Type': 'application/json'}
 
 
 def recast_send_request_dialog(text, conversation_id=None, language=None):
     if conversation_id is None:
         conversation_id = DEFAULT_ID
+    # The dialog must see the memory changes which are not written yet
+    try:
+        memory_store.flush(conversation_id)
+    except Exception as e:
+        logger.error('Memory of {} not written: {}'.format(conversation_id, e))
     data = {'message': {'content': text, 'type': "text"}, 'conversation_id': conversation_id}
     if language:
         data['language'] = language
     data = json.dumps(data)
-    res = requests.post(url='https://api.recast.ai/build/v1/dialog', data=data, headers=headers)
+    res = session.post(url='https://api.recast.ai/build/v1/dialog', data=data, headers=get_headers())
     if res.status_code == 200:
-        return res.json()
+        res = res.json()
+        if conversation_id in memory_store:
+            memory_store.observe(conversation_id, res['results']['conversation']['memory'])
+        return res
     elif res.status_code == 401:
         raise InvalidCredentialsException(api_name='Recast')
     else:
@@ -29,11 +71,57 @@ def recast_send_request_dialog(text, conversation_id=None, language=None):
 
 
 def recast_send_request_intent(text, language=None):
+    # The response contains the source text and the raw values of the entities: it only answers the exact same text
+    key = (intent_cache_version(), text, language)
+    return intent_cache.get_or_load(key, lambda: (
+        intent_flight.do(key, request_intent, text, language),
+        INTENT_CACHE_TTL
+    ))
+
+
+def recast_send_request_intents(texts, language=None):
+    """
+    Classify the texts concurrently.
+    Yields the result of each text in order, as a (response, None) or (None, exception) tuple.
+    """
+    futures = [intent_batch_pool.submit(recast_send_request_intent, text, language) for text in texts]
+    try:
+        for future in futures:
+            try:
+                yield future.result(), None
+            except Exception as e:
+                yield None, e
+    finally:
+        # The client may be gone before the end of the batch
+        for future in futures:
+            future.cancel()
+
+
+def intent_cache_version():
+    if not INTENT_CACHE_STAMP:
+        return RECAST_BOT_VERSION
+    try:
+        return RECAST_BOT_VERSION, os.stat(INTENT_CACHE_STAMP).st_mtime_ns
+    except FileNotFoundError:
+        return RECAST_BOT_VERSION, None
+
+
+def clear_intent_cache():
+    """
+    Invalidate the cached intents, of every worker sharing INTENT_CACHE_STAMP.
+    """
+    if INTENT_CACHE_STAMP:
+        with open(INTENT_CACHE_STAMP, 'a'):
+            os.utime(INTENT_CACHE_STAMP, None)
+    intent_cache.clear()
+
+
+def request_intent(text, language=None):
     data = {'text': text}
     if language:
         data['language'] = language
     data = json.dumps(data)
-    res = requests.post(url='https://api.recast.ai/v2/request', data=data, headers=headers)
+    res = session.post(url='https://api.recast.ai/v2/request', data=data, headers=get_headers())
     if res.status_code == 200:
         return res.json()
     elif res.status_code == 401:
@@ -43,35 +131,66 @@ def recast_send_request_intent(text, language=None):
 
 
 def recast_send_request_memory(field, user_id, value=None):
-    url = 'https://api.recast.ai/build/v1/users/' + RECAST_CREDENTIALS['user_slug'] + '/bots/' + RECAST_CREDENTIALS['bot_slug'] + '/builders/v1/conversation_states/' + user_id
-    res = requests.get(url=url, headers=headers)
+    return recast_send_request_memory_fields({field: value}, user_id)
+
+
+def recast_send_request_memory_fields(fields, user_id):
+    """
+    Change several fields of the memory of the user at once (a None value deletes the field).
+    Changes are applied locally and written to Recast in the background, unless they don't change anything.
+    """
+    changes = {}
+    for field, value in fields.items():
+        changes.update(memory_changes(field, value))
+    return {'results': memory_store.update(user_id, changes)}
+
+
+def memory_changes(field, value=None):
+    # Case: deleting memory field
+    if value is None:
+        return {field: None}
+    # Case: replacing username
+    if field == 'username':
+        return {'username': {
+            "fullname": value,
+            "raw": value,
+            "confidence": 0.99
+        }}
+    # TODO: add others fields here !
+    return {}
+
+
+def memory_url(user_id):
+    credentials = providers.get('recast_credentials')
+    return 'https://api.recast.ai/build/v1/users/' + credentials['user_slug'] + '/bots/' + credentials['bot_slug'] + '/builders/v1/conversation_states/' + user_id
+
+
+def request_memory_state(user_id):
+    url = memory_url(user_id)
+    headers = get_headers()
+    res = session.get(url=url, headers=headers)
     if res.status_code == 404:
         # Case: user conversation doesn't exist yet
         recast_send_request_dialog(TEST_TEXT, user_id)
-        res = requests.get(url=url, headers=headers)
+        res = session.get(url=url, headers=headers)
     if res.status_code == 200:
-        memory = res.json()['results']['memory']
-        # Case: deleting memory field
-        if value is None and memory.get(field) is not None:
-            del memory[field]
-        # Case: replacing username
-        elif field == 'username':
-            memory['username'] = {
-                "fullname": value,
-                "raw": value,
-                "confidence": 0.99
-            }
-        # TODO: add others fields here !
-        # Update the memory
-        data = json.dumps({'memory': memory})
-        res1 = requests.put(url=url, data=data, headers=headers)
-        if res1.status_code == 200:
-            return res1.json()
-        elif res1.status_code == 401:
-            raise InvalidCredentialsException(api_name='Recast')
-        else:
-            raise ExternalAPIException(api_name='Recast', description='memory_update({})'.format(res1.status_code))
+        return res.json()['results']
     elif res.status_code == 401 or res.status_code == 404:
         raise InvalidCredentialsException(api_name='Recast')
     else:
         raise ExternalAPIException(api_name='Recast', description='memory_get({})\n{}'.format(res.status_code, res.content))
+
+
+def save_memory_state(user_id, memory):
+    data = json.dumps({'memory': memory})
+    res = session.put(url=memory_url(user_id), data=data, headers=get_headers())
+    if res.status_code == 200:
+        return res.json()['results']
+    elif res.status_code == 401:
+        raise InvalidCredentialsException(api_name='Recast')
+    else:
+        raise ExternalAPIException(api_name='Recast', description='memory_update({})'.format(res.status_code))
+
+
+memory_store = MemoryStore(request_memory_state, save_memory_state, flush_delay=MEMORY_FLUSH_DELAY, ttl=MEMORY_TTL,
+                           maxsize=MEMORY_STORE_SIZE, retries=MEMORY_FLUSH_RETRIES)
@@ -0,0 +1,209 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from api.cache import CACHES
+
+logger = logging.getLogger(__name__)
+
+# Orders the local changes, so a flush only acknowledges the changes it has written
+sequence = itertools.count()
+
+
+def apply_changes(memory, changes):
+    """
+    Copy of memory with the changes (field -> (value, sequence)) applied, a None value deletes the field.
+    """
+    memory = dict(memory)
+    for field, (value, _) in changes.items():
+        if value is None:
+            memory.pop(field, None)
+        else:
+            memory[field] = value
+    return memory
+
+
+class Conversation:
+    def __init__(self):
+        # Last conversation state known from Recast
+        self.state = None
+        self.loaded_at = None
+        # Incremented each time a new state is known, so a flush notices the dialogs which ran meanwhile
+        self.version = 0
+        # Local changes not written to Recast yet: field -> (value, sequence)
+        self.pending = {}
+        self.timer = None
+        self.retries = 0
+        # Serializes the loads and writes of the conversation
+        self.io_lock = threading.RLock()
+        self.flushing = False
+
+
+class MemoryStore:
+    """
+    Local mirror of the conversation memory of each user.
+    Memory is read and changed locally, changes are coalesced and written behind to Recast after flush_delay.
+    load(user_id) returns the conversation state, save(user_id, memory) writes the memory and returns the new state.
+    """
+
+    def __init__(self, load, save, flush_delay=0.2, ttl=60, maxsize=10000, retries=3):
+        self.load = load
+        self.save = save
+        self.flush_delay = flush_delay
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.retries = retries
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        CACHES.append(self)
+
+    def __contains__(self, user_id):
+        return user_id in self._conversations
+
+    def get(self, user_id):
+        conversation = self._conversation(user_id)
+        with self._lock:
+            return self._view(conversation)
+
+    def update(self, user_id, changes):
+        """
+        Change fields of the memory (a None value deletes the field), returns the conversation state with the changes.
+        """
+        conversation = self._conversation(user_id)
+        with self._lock:
+            memory = self._view(conversation)['memory']
+            changed = False
+            for field, value in changes.items():
+                # Changes which don't change anything are not written
+                if memory.get(field) != value or (value is None and field in memory):
+                    conversation.pending[field] = value, next(sequence)
+                    changed = True
+            if changed:
+                conversation.retries = 0
+                self._schedule(user_id, conversation, self.flush_delay)
+            return self._view(conversation)
+
+    def observe(self, user_id, memory):
+        """
+        Record the memory returned by a dialog, the changes not written yet still apply on top of it.
+        """
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is None or conversation.state is None:
+                return
+            conversation.state = dict(conversation.state, memory=memory)
+            conversation.loaded_at = time.monotonic()
+            conversation.version += 1
+
+    def flush(self, user_id):
+        """
+        Write the pending changes of the user to Recast now.
+        The memory is read again from Recast first: only the changed fields are written over it,
+        so the changes made meanwhile by other workers or dialogs are kept.
+        """
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+        if conversation is None:
+            return
+        with conversation.io_lock:
+            # Reading the memory may start a dialog, which flushes the memory first
+            if conversation.flushing:
+                return
+            with self._lock:
+                if not conversation.pending:
+                    return
+                changes = dict(conversation.pending)
+                version = conversation.version
+            conversation.flushing = True
+            try:
+                state = self.load(user_id)
+                memory = apply_changes(state['memory'], changes)
+                # Nothing is written when the changes are already there, or were undone
+                if memory != state['memory']:
+                    state = self.save(user_id, memory)
+            finally:
+                conversation.flushing = False
+            with self._lock:
+                if conversation.version != version:
+                    # A dialog ran during the write and its memory may have been overwritten:
+                    # keep the changes pending, they are written again on top of the memory of the dialog
+                    self._schedule(user_id, conversation, self.flush_delay)
+                    return
+                conversation.state = state
+                conversation.loaded_at = time.monotonic()
+                conversation.version += 1
+                for field, change in changes.items():
+                    # Fields changed again during the write stay pending
+                    if conversation.pending.get(field) == change:
+                        del conversation.pending[field]
+
+    def flush_all(self):
+        with self._lock:
+            user_ids = list(self._conversations)
+        for user_id in user_ids:
+            try:
+                self.flush(user_id)
+            except Exception as e:
+                logger.error('Memory of {} not written: {}'.format(user_id, e))
+
+    def clear(self):
+        with self._lock:
+            for conversation in self._conversations.values():
+                if conversation.timer:
+                    conversation.timer.cancel()
+            self._conversations.clear()
+
+    def _conversation(self, user_id):
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                conversation = self._conversations[user_id] = Conversation()
+                self._evict()
+            else:
+                self._conversations.move_to_end(user_id)
+        if not self._is_fresh(conversation):
+            with conversation.io_lock:
+                if not self._is_fresh(conversation):
+                    state = self.load(user_id)
+                    with self._lock:
+                        conversation.state = state
+                        conversation.loaded_at = time.monotonic()
+                        conversation.version += 1
+        return conversation
+
+    def _is_fresh(self, conversation):
+        return conversation.state is not None and time.monotonic() - conversation.loaded_at < self.ttl
+
+    def _view(self, conversation):
+        return dict(conversation.state, memory=apply_changes(conversation.state['memory'], conversation.pending))
+
+    def _evict(self):
+        if len(self._conversations) <= self.maxsize:
+            return
+        for user_id, conversation in list(self._conversations.items()):
+            if len(self._conversations) <= self.maxsize:
+                break
+            # Conversations being loaded or with changes to write are kept
+            if conversation.state is not None and not conversation.pending and conversation.timer is None:
+                del self._conversations[user_id]
+
+    def _schedule(self, user_id, conversation, delay):
+        if conversation.timer is None:
+            conversation.timer = threading.Timer(delay, self._flush_later, [user_id, conversation])
+            conversation.timer.daemon = True
+            conversation.timer.start()
+
+    def _flush_later(self, user_id, conversation):
+        with self._lock:
+            conversation.timer = None
+        try:
+            self.flush(user_id)
+        except Exception as e:
+            logger.error('Memory of {} not written: {}'.format(user_id, e))
+            with self._lock:
+                conversation.retries += 1
+                # Changes are kept after the last retry, they are written with the next flush of the user
+                if conversation.retries <= self.retries:
+                    self._schedule(user_id, conversation, self.flush_delay * 2 ** conversation.retries)
@@ -77,7 +77,7 @@ def recast_memory_request():
     return {
         'field': 'username',
         'user_id': 'DEFAULT',
-        'value': 'Jean-Mi'
+        'value': 'Jean-Michel'
     }
 
 
@@ -1,14 +1,17 @@
 import pytest
 import json
+import time
 from mock import patch, MagicMock, Mock
 from api.exceptions import OperationFailedException, InvalidCredentialsException, ExternalAPIException
-from api.nlp.recast.helpers import requests, recast_send_request_dialog, recast_send_request_intent, \
-    recast_send_request_memory
+from api.session import session
+from api.nlp.recast.helpers import recast_send_request_dialog, recast_send_request_intent, \
+    recast_send_request_memory, recast_send_request_memory_fields, recast_send_request_intents, clear_intent_cache, \
+    memory_store
 from api.nlp.recast.constants import DEFAULT_ID
 
 
 # Ensure that NLP behaves correctly
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_recast_answer_send_request(mock_post, recast_answer_request, recast_answer_response):
     mock_post.return_value = Mock(status_code=200, json=Mock(return_value=recast_answer_response))
     res = recast_send_request_dialog(recast_answer_request['text'], recast_answer_request['conversation_id'],
@@ -21,7 +24,7 @@ def test_recast_answer_send_request(mock_post, recast_answer_request, recast_ans
 
 
 # Ensure that NLP behaves correctly when id and language is missing
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_recast_answer_id_and_language_missing(mock_post, recast_answer_request):
     def side_effect(**kwargs):
         assert kwargs.get('data')
@@ -37,7 +40,7 @@ def test_recast_answer_id_and_language_missing(mock_post, recast_answer_request)
 
 
 # Ensure that NLP behaves correctly when credentials are wrong/missing
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_recast_answer_invalid_credentials(mock_post, recast_answer_request):
     mock_post.return_value = Mock(status_code=401)
     with pytest.raises(InvalidCredentialsException):
@@ -47,7 +50,7 @@ def test_recast_answer_invalid_credentials(mock_post, recast_answer_request):
 
 
 # Ensure that NLP behaves correctly when Recast is offline
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_recast_answer_recast_offline(mock_post, recast_answer_request):
     mock_post.return_value = Mock(status_code=500)
     with pytest.raises(ExternalAPIException):
@@ -57,42 +60,49 @@ def test_recast_answer_recast_offline(mock_post, recast_answer_request):
 
 
 # Ensure that NLP behaves correctly when requesting memory update
-@patch.object(requests, 'put', autospec=True)
-@patch.object(requests, 'get', autospec=True)
-def test_recast_memory_send_request(mock_put, mock_get, recast_memory_request, recast_memory_response):
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
+def test_recast_memory_send_request(mock_get, mock_put, recast_memory_request, recast_memory_response):
     mock_get.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
     mock_put.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
     res = recast_send_request_memory(field=recast_memory_request['field'], user_id=recast_memory_request['user_id'],
                                      value=recast_memory_request['value'])
 
     assert mock_get.call_count == 1
-    assert mock_put.call_count == 1
+    assert mock_put.call_count == 0
     assert res['results']['conversation_id'] == recast_memory_request['user_id']
     assert res['results']['memory'][recast_memory_request['field']]
 
+    # The memory is read again before being written
+    memory_store.flush(recast_memory_request['user_id'])
+    assert mock_get.call_count == 2
+    assert mock_put.call_count == 1
+
 
 # Ensure that NLP behaves correctly when conversation doesn't exist yet in memory update
 @patch('api.nlp.recast.helpers.recast_send_request_dialog', autospec=True)
-@patch.object(requests, 'put', autospec=True)
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_recast_memory_conversation_doesnt_exist(mock_get, mock_put, mock_recast_send_request_dialog,
                                                  recast_memory_request, recast_memory_response):
     mock_get.side_effect = [Mock(status_code=404, json=Mock(return_value=recast_memory_response)),
+                            Mock(status_code=200, json=Mock(return_value=recast_memory_response)),
                             Mock(status_code=200, json=Mock(return_value=recast_memory_response))]
     mock_put.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
     res = recast_send_request_memory(field=recast_memory_request['field'], user_id=recast_memory_request['user_id'],
                                      value=recast_memory_request['value'])
+    memory_store.flush(recast_memory_request['user_id'])
 
     assert mock_recast_send_request_dialog.call_count == 1
-    assert mock_get.call_count == 2
+    assert mock_get.call_count == 3
     assert mock_put.call_count == 1
     assert res['results']['conversation_id'] == recast_memory_request['user_id']
     assert res['results']['memory'][recast_memory_request['field']]
 
 
 # Ensure that NLP behaves correctly when value is empty
-@patch.object(requests, 'put', autospec=True)
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_recast_memory_field_is_null(mock_get, mock_put: MagicMock, recast_memory_request, recast_memory_response):
     def side_effect(**kwargs):
         assert kwargs.get('data')
@@ -103,28 +113,86 @@ def test_recast_memory_field_is_null(mock_get, mock_put: MagicMock, recast_memor
     mock_get.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
     mock_put.side_effect = side_effect
     res = recast_send_request_memory(field=recast_memory_request['field'], user_id=recast_memory_request['user_id'])
+    memory_store.flush(recast_memory_request['user_id'])
 
-    assert mock_get.call_count == 1
+    assert mock_get.call_count == 2
     assert mock_put.call_count == 1
     assert res['results']['conversation_id'] == recast_memory_request['user_id']
+    assert recast_memory_request['field'] not in res['results']['memory']
+
+
+# Ensure that memory updates are served locally and coalesced into a single write
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
+def test_recast_memory_coalesced(mock_get, mock_put, recast_memory_request, recast_memory_response):
+    mock_get.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
+    mock_put.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
+    recast_send_request_memory(field='username', user_id=recast_memory_request['user_id'], value='Jean')
+    res = recast_send_request_memory(field='username', user_id=recast_memory_request['user_id'], value='Michel')
+    memory_store.flush(recast_memory_request['user_id'])
+
+    assert mock_get.call_count == 2
+    assert mock_put.call_count == 1
+    assert res['results']['memory']['username']['raw'] == 'Michel'
+    assert json.loads(mock_put.call_args[1]['data'])['memory']['username']['raw'] == 'Michel'
+
+
+# Ensure that several fields are changed at once, and nothing is written when they don't change anything
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
+def test_recast_memory_fields(mock_get, mock_put, recast_memory_request, recast_memory_response):
+    mock_get.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
+    mock_put.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
+    res = recast_send_request_memory_fields({'username': 'Jean-Mi', 'age': None}, recast_memory_request['user_id'])
+    memory_store.flush(recast_memory_request['user_id'])
+
+    assert mock_put.call_count == 0
+    assert res['results']['memory'] == recast_memory_response['results']['memory']
+
+    res = recast_send_request_memory_fields({'username': None}, recast_memory_request['user_id'])
+    memory_store.flush(recast_memory_request['user_id'])
+
+    assert mock_get.call_count == 2
+    assert mock_put.call_count == 1
+    assert res['results']['memory'] == {}
+
+
+# Ensure that pending memory changes are written before a dialog, and the memory of the dialog is mirrored
+@patch.object(session, 'post', autospec=True)
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
+def test_recast_memory_dialog(mock_get, mock_put, mock_post, recast_memory_request, recast_memory_response,
+                              recast_answer_response):
+    mock_get.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
+    mock_put.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
+    recast_answer_response['results']['conversation']['memory'] = {'weather-location': {'formatted': 'Paris'}}
+    mock_post.return_value = Mock(status_code=200, json=Mock(return_value=recast_answer_response))
+    recast_send_request_memory(field='username', user_id=recast_memory_request['user_id'], value='Jean')
+    recast_send_request_dialog('Bonjour', recast_memory_request['user_id'])
+
+    assert mock_put.call_count == 1
+    memory = memory_store.get(recast_memory_request['user_id'])['memory']
+    assert memory == {'weather-location': {'formatted': 'Paris'}}
+    assert mock_get.call_count == 2
 
 
 # Ensure that NLP behaves correctly when credentials are invalids #1
-@patch.object(requests, 'put', autospec=True)
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_recast_memory_invalid_credentials_1(mock_get, mock_put: MagicMock, recast_memory_request, recast_memory_response):
     mock_get.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
     mock_put.return_value = Mock(status_code=401)
+    recast_send_request_memory(field=recast_memory_request['field'], user_id=recast_memory_request['user_id'],
+                               value=recast_memory_request['value'])
     with pytest.raises(InvalidCredentialsException):
-        recast_send_request_memory(field=recast_memory_request['field'], user_id=recast_memory_request['user_id'],
-                                   value=recast_memory_request['value'])
-    assert mock_get.call_count == 1
+        memory_store.flush(recast_memory_request['user_id'])
+    assert mock_get.call_count == 2
     assert mock_put.call_count == 1
 
 
 # Ensure that NLP behaves correctly when credentials are invalids #2
-@patch.object(requests, 'put', autospec=True)
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_recast_memory_invalid_credentials_2(mock_get, mock_put: MagicMock, recast_memory_request):
     mock_get.return_value = Mock(status_code=401)
     with pytest.raises(InvalidCredentialsException):
@@ -135,21 +203,22 @@ def test_recast_memory_invalid_credentials_2(mock_get, mock_put: MagicMock, reca
 
 
 # Ensure that NLP behaves correctly when recast is not working properly #1
-@patch.object(requests, 'put', autospec=True)
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_recast_memory_recast_offline_1(mock_get, mock_put: MagicMock, recast_memory_request, recast_memory_response):
     mock_get.return_value = Mock(status_code=200, json=Mock(return_value=recast_memory_response))
     mock_put.return_value = Mock(status_code=500)
+    recast_send_request_memory(field=recast_memory_request['field'], user_id=recast_memory_request['user_id'],
+                               value=recast_memory_request['value'])
     with pytest.raises(ExternalAPIException):
-        recast_send_request_memory(field=recast_memory_request['field'], user_id=recast_memory_request['user_id'],
-                                   value=recast_memory_request['value'])
-    assert mock_get.call_count == 1
+        memory_store.flush(recast_memory_request['user_id'])
+    assert mock_get.call_count == 2
     assert mock_put.call_count == 1
 
 
 # Ensure that NLP behaves correctly when recast is not working properly #2
-@patch.object(requests, 'put', autospec=True)
-@patch.object(requests, 'get', autospec=True)
+@patch.object(session, 'put', autospec=True)
+@patch.object(session, 'get', autospec=True)
 def test_recast_memory_recast_offline_2(mock_get, mock_put: MagicMock, recast_memory_request):
     mock_get.return_value = Mock(status_code=500)
     with pytest.raises(ExternalAPIException):
@@ -160,7 +229,7 @@ def test_recast_memory_recast_offline_2(mock_get, mock_put: MagicMock, recast_me
 
 
 # Ensure that NLP behaves correctly when requesting intent
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_recast_intent_send_request(mock_post, recast_answer_request, recast_answer_response):
     mock_post.return_value = Mock(status_code=200, json=Mock(return_value=recast_answer_response))
     res = recast_send_request_intent(text=recast_answer_request['text'], language=recast_answer_request['language'])
@@ -169,8 +238,49 @@ def test_recast_intent_send_request(mock_post, recast_answer_request, recast_ans
     assert res['results']['nlp']['source'] == recast_answer_request['text']
 
 
+# Ensure that intents are cached by text and language until the cache is cleared
+@patch('api.nlp.recast.helpers.INTENT_CACHE_STAMP', '')
+@patch.object(session, 'post', autospec=True)
+def test_recast_intent_cached(mock_post, recast_answer_request, recast_answer_response, tmpdir):
+    mock_post.return_value = Mock(status_code=200, json=Mock(return_value=recast_answer_response))
+    text = recast_answer_request['text']
+    language = recast_answer_request['language']
+
+    assert recast_send_request_intent(text, language) == recast_answer_response
+    assert recast_send_request_intent(text, language) == recast_answer_response
+    assert mock_post.call_count == 1
+
+    # The response belongs to the exact text: other casing is analyzed again
+    recast_send_request_intent(text.upper(), language)
+    assert mock_post.call_count == 2
+
+    recast_send_request_intent(text, 'en')
+    assert mock_post.call_count == 3
+
+    clear_intent_cache()
+    recast_send_request_intent(text, language)
+    assert mock_post.call_count == 4
+
+    # Other workers see the stamp file touched
+    stamp = str(tmpdir.join('intents'))
+    with patch('api.nlp.recast.helpers.INTENT_CACHE_STAMP', stamp):
+        recast_send_request_intent(text, language)
+        with patch('api.nlp.recast.helpers.intent_cache.clear'):
+            clear_intent_cache()
+        recast_send_request_intent(text, language)
+    assert mock_post.call_count == 6
+
+    # Failures aren't cached
+    mock_post.return_value = Mock(status_code=500)
+    with pytest.raises(ExternalAPIException):
+        recast_send_request_intent('other', language)
+    mock_post.return_value = Mock(status_code=200, json=Mock(return_value=recast_answer_response))
+    recast_send_request_intent('other', language)
+    assert mock_post.call_count == 8
+
+
 # Ensure that NLP behaves correctly when credentials are invalids for intent
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_recast_intent_invalid_credentials(mock_post, recast_answer_request):
     mock_post.return_value = Mock(status_code=401)
     with pytest.raises(InvalidCredentialsException):
@@ -179,9 +289,28 @@ def test_recast_intent_invalid_credentials(mock_post, recast_answer_request):
 
 
 # Ensure that NLP behaves correctly when credentials are invalids for intent
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_recast_intent_recast_offline(mock_post, recast_answer_request):
     mock_post.return_value = Mock(status_code=500)
     with pytest.raises(ExternalAPIException):
         recast_send_request_intent(text=recast_answer_request['text'], language=recast_answer_request['language'])
     assert mock_post.call_count == 1
+
+
+# Ensure that batches are classified concurrently, in order, with the error of each text
+@patch('api.nlp.recast.helpers.recast_send_request_intent', autospec=True)
+def test_recast_send_request_intents(mock_recast_send_request_intent):
+    def side_effect(text, language):
+        time.sleep(0.1 * len(text))
+        if text == 'x':
+            raise ExternalAPIException()
+        return {'results': text}
+
+    mock_recast_send_request_intent.side_effect = side_effect
+    start = time.monotonic()
+    results = list(recast_send_request_intents(['aaa', 'x', 'a'], 'fr'))
+
+    assert time.monotonic() - start < 0.5
+    assert results[0] == ({'results': 'aaa'}, None)
+    assert results[1][0] is None and isinstance(results[1][1], ExternalAPIException)
+    assert results[2] == ({'results': 'a'}, None)
@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+from mock import Mock
+
+from api.nlp.recast.memory import MemoryStore
+
+
+def make_store(recast, **kwargs):
+    """
+    Store reading and writing the memory of recast, a dict of user_id -> memory shared like Recast's.
+    """
+    def save(user_id, memory):
+        recast[user_id] = dict(memory)
+        return {'conversation_id': user_id, 'memory': dict(memory)}
+
+    load = Mock(side_effect=lambda user_id: {'conversation_id': user_id, 'memory': dict(recast.get(user_id, {}))})
+    kwargs.setdefault('flush_delay', 60)
+    return MemoryStore(load, Mock(side_effect=save), **kwargs), load
+
+
+# Ensure that the memory is loaded once, then read and changed locally
+def test_memory_store_local():
+    recast = {'user': {'username': 'Jean'}}
+    store, load = make_store(recast)
+    assert store.get('user')['memory'] == {'username': 'Jean'}
+    state = store.update('user', {'username': None, 'age': 30})
+
+    assert state == {'conversation_id': 'user', 'memory': {'age': 30}}
+    assert store.get('user')['memory'] == {'age': 30}
+    assert load.call_count == 1
+    assert store.save.call_count == 0
+    assert recast['user'] == {'username': 'Jean'}
+
+
+# Ensure that the changes are written at once, and only once
+def test_memory_store_flush():
+    recast = {'user': {'username': 'Jean'}}
+    store, load = make_store(recast)
+    store.update('user', {'username': 'Michel'})
+    store.update('user', {'age': 30})
+    store.flush('user')
+    store.flush('user')
+
+    assert store.save.call_count == 1
+    assert recast['user'] == {'username': 'Michel', 'age': 30}
+
+
+# Ensure that a worker only writes the fields it changed over the memory written by others
+def test_memory_store_other_worker():
+    recast = {'user': {'username': 'Jean'}}
+    store, _ = make_store(recast)
+    other_store, _ = make_store(recast)
+    store.get('user')
+    other_store.get('user')
+
+    other_store.update('user', {'age': 30})
+    store.update('user', {'username': 'Michel'})
+    other_store.flush('user')
+    store.flush('user')
+
+    assert recast['user'] == {'username': 'Michel', 'age': 30}
+    assert store.get('user')['memory'] == {'username': 'Michel', 'age': 30}
+
+
+# Ensure that changes which don't change anything, or which were undone, are not written
+def test_memory_store_unchanged():
+    recast = {'user': {'username': 'Jean'}}
+    store, load = make_store(recast)
+    store.update('user', {'username': 'Jean', 'age': None})
+    store.flush('user')
+    store.update('user', {'username': 'Michel'})
+    store.update('user', {'username': 'Jean'})
+    store.flush('user')
+
+    assert store.save.call_count == 0
+    assert store.get('user')['memory'] == {'username': 'Jean'}
+
+
+# Ensure that the changes are written in the background
+def test_memory_store_write_behind():
+    written = threading.Event()
+    recast = {}
+    store, load = make_store(recast, flush_delay=0)
+    store.save.side_effect = lambda user_id, memory: written.set() or {'memory': memory}
+    store.update('user', {'username': 'Jean'})
+
+    assert written.wait(5)
+    assert store.save.call_args[0] == ('user', {'username': 'Jean'})
+
+
+# Ensure that the changes are written again when a dialog ran during the write
+def test_memory_store_concurrent_dialog():
+    recast = {}
+    store, load = make_store(recast)
+    store.update('user', {'username': 'Jean'})
+    save = store.save.side_effect
+
+    def save_during_dialog(user_id, memory):
+        # The dialog saves its memory after the write, without the change
+        recast[user_id] = {'weather-location': 'Paris'}
+        store.observe(user_id, recast[user_id])
+        return {'memory': memory}
+    store.save.side_effect = save_during_dialog
+    store.flush('user')
+
+    assert store.get('user')['memory'] == {'weather-location': 'Paris', 'username': 'Jean'}
+    store.save.side_effect = save
+    store.flush('user')
+    assert recast['user'] == {'weather-location': 'Paris', 'username': 'Jean'}
+
+
+# Ensure that the changes are kept when they can't be written
+def test_memory_store_flush_error():
+    recast = {}
+    store, load = make_store(recast)
+    store.update('user', {'username': 'Jean'})
+    save = store.save.side_effect
+    store.save.side_effect = ValueError()
+    with pytest.raises(ValueError):
+        store.flush('user')
+
+    store.save.side_effect = save
+    store.flush_all()
+    assert recast['user'] == {'username': 'Jean'}
+
+
+# Ensure that the memory is read again once expired, and that only users without pending changes are evicted
+def test_memory_store_expiry():
+    store, load = make_store({}, ttl=0, maxsize=1)
+    store.get('user')
+    store.get('user')
+    assert load.call_count == 2
+
+    store.update('user', {'username': 'Jean'})
+    store.get('other')
+    assert store.get('user')['memory'] == {'username': 'Jean'}
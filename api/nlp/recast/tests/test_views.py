@@ -4,8 +4,7 @@ from mock import patch, MagicMock, Mock
 from flask import url_for
 
 from api.exceptions import BadParameterException, MissingParameterException, InvalidCredentialsException, ExternalAPIException, APIException
-from api.nlp.recast.helpers import requests, recast_send_request_dialog, recast_send_request_intent, \
-    recast_send_request_memory
+from api.nlp.recast.helpers import recast_send_request_dialog, recast_send_request_intent
 from api.nlp.recast.constants import DEFAULT_ID, LANGUAGES_CODE, SUPPORTED_FIELDS
 
 
@@ -208,6 +207,60 @@ def test_intent_success(mock_recast_send_request_intent, client, recast_intent_r
     assert res.status_code == 200
 
 
+# Ensure that batches of texts are classified in order
+@patch('api.nlp.recast.views.recast_send_request_intents', autospec=True)
+def test_intent_batch_success(mock_recast_send_request_intents, client, recast_intent_response):
+    mock_recast_send_request_intents.side_effect = lambda texts, language: iter([
+        (recast_intent_response, None),
+        (None, ExternalAPIException(api_name='Recast'))
+    ])
+    data = {'texts': ['Salut', 'Bonjour'], 'language': 'fr'}
+
+    res = client.post(url_for('nlp_recast.intent_batch'), content_type='application/json', data=json.dumps(data))
+    assert res.status_code == 200
+    assert json.loads(res.data) == {'results': [
+        recast_intent_response['results'],
+        {'errors': [dict(ExternalAPIException(api_name='Recast'))]}
+    ]}
+    mock_recast_send_request_intents.assert_called_with(['Salut', 'Bonjour'], 'fr')
+
+    # Streamed as NDJSON
+    data['stream'] = True
+    res = client.post(url_for('nlp_recast.intent_batch'), content_type='application/json', data=json.dumps(data))
+    assert res.status_code == 200
+    assert res.mimetype == 'application/x-ndjson'
+    lines = res.data.decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == [
+        recast_intent_response['results'],
+        {'errors': [dict(ExternalAPIException(api_name='Recast'))]}
+    ]
+
+
+# Ensure that batches are checked before being classified
+@patch('api.nlp.recast.views.recast_send_request_intents', autospec=True)
+def test_intent_batch_bad_request(mock_recast_send_request_intents, client):
+    for data, error in [
+        ({'language': 'fr'}, MissingParameterException('texts')),
+        ({'texts': 'Salut'}, BadParameterException('texts')),
+        ({'texts': ['Salut', None]}, BadParameterException('texts')),
+        ({'texts': ['Salut'] * 1001}, BadParameterException('texts')),
+        ({'texts': ['Salut'], 'language': 'xx'}, BadParameterException('language', valid_values=LANGUAGES_CODE))
+    ]:
+        res = client.post(url_for('nlp_recast.intent_batch'), content_type='application/json', data=json.dumps(data))
+        assert res.status_code == 400
+        assert json.loads(res.data) == {'errors': [dict(error)]}
+    assert mock_recast_send_request_intents.call_count == 0
+
+
+# Ensure that the cached intents can be cleared
+@patch('api.nlp.recast.views.clear_intent_cache', autospec=True)
+def test_intent_cache_clear(mock_clear_intent_cache, client):
+    res = client.delete(url_for('nlp_recast.intent_cache'))
+
+    assert res.status_code == 204
+    assert mock_clear_intent_cache.call_count == 1
+
+
 # Ensure that NLP behaves correctly when provided bad language
 @patch('api.nlp.recast.views.recast_send_request_intent', autospec=True)
 def test_intent_bad_language(mock_recast_send_request_intent, client, recast_intent_request):
@@ -331,9 +384,9 @@ def test_intent_recast_invalid_credentials(mock_recast_send_request_intent, clie
 
 
 # Ensure that NLP behaves correctly when provided correct information
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_success(mock_recast_send_request_memory, client, recast_memory_request, recast_memory_response):
-    mock_recast_send_request_memory.return_value = recast_memory_response
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_success(mock_recast_send_request_memory_fields, client, recast_memory_request, recast_memory_response):
+    mock_recast_send_request_memory_fields.return_value = recast_memory_response
 
     res = client.post(
         url_for('nlp_recast.memory'),
@@ -345,13 +398,49 @@ def test_memory_success(mock_recast_send_request_memory, client, recast_memory_r
         })
     )
     assert res.status_code == 200
-    assert mock_recast_send_request_memory.call_count == 1
+    assert mock_recast_send_request_memory_fields.call_count == 1
+
+
+# Ensure that several fields can be changed at once
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_fields_success(mock_recast_send_request_memory_fields, client, recast_memory_request,
+                               recast_memory_response):
+    mock_recast_send_request_memory_fields.return_value = recast_memory_response
+
+    res = client.post(
+        url_for('nlp_recast.memory'),
+        content_type='application/json',
+        data=json.dumps({
+            'fields': {'username': recast_memory_request['value']},
+            'user_id': recast_memory_request['user_id'],
+        })
+    )
+    assert res.status_code == 200
+    mock_recast_send_request_memory_fields.assert_called_once_with({'username': recast_memory_request['value']},
+                                                                   recast_memory_request['user_id'])
+
+
+# Ensure that NLP behaves correctly when one of the fields is not supported
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_fields_bad_field(mock_recast_send_request_memory_fields, client, recast_memory_request):
+    res = client.post(
+        url_for('nlp_recast.memory'),
+        content_type='application/json',
+        data=json.dumps({
+            'fields': {'username': recast_memory_request['value'], 'xX-yY-zZ': None},
+            'user_id': recast_memory_request['user_id'],
+        })
+    )
+    expected_result = {'errors': [dict(BadParameterException('field', valid_values=SUPPORTED_FIELDS))]}
+    assert res.status_code == 400
+    assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
+    assert mock_recast_send_request_memory_fields.call_count == 0
 
 
 # Ensure that NLP behaves correctly when field is not supported
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_bad_field(mock_recast_send_request_memory, client, recast_memory_request, recast_memory_response):
-    mock_recast_send_request_memory.return_value = recast_memory_response
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_bad_field(mock_recast_send_request_memory_fields, client, recast_memory_request, recast_memory_response):
+    mock_recast_send_request_memory_fields.return_value = recast_memory_response
 
     res = client.post(
         url_for('nlp_recast.memory'),
@@ -365,12 +454,12 @@ def test_memory_bad_field(mock_recast_send_request_memory, client, recast_memory
     expected_result = {'errors': [dict(BadParameterException('field', valid_values=SUPPORTED_FIELDS))]}
     assert res.status_code == 400
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
-    assert mock_recast_send_request_memory.call_count == 0
+    assert mock_recast_send_request_memory_fields.call_count == 0
 
 
 # Ensure that NLP behaves correctly when field is missing
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_missing_field(mock_recast_send_request_memory, client, recast_memory_request, recast_memory_response):
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_missing_field(mock_recast_send_request_memory_fields, client, recast_memory_request, recast_memory_response):
     res = client.post(
         url_for('nlp_recast.memory'),
         content_type='application/json',
@@ -383,12 +472,12 @@ def test_memory_missing_field(mock_recast_send_request_memory, client, recast_me
     expected_result = {'errors': [dict(MissingParameterException('field'))]}
     assert res.status_code == 400
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
-    assert mock_recast_send_request_memory.call_count == 0
+    assert mock_recast_send_request_memory_fields.call_count == 0
 
 
 # Ensure that NLP behaves correctly when user id is missing
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_missing_audio_file(mock_recast_send_request_memory, client, recast_memory_request, recast_memory_response):
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_missing_audio_file(mock_recast_send_request_memory_fields, client, recast_memory_request, recast_memory_response):
     res = client.post(
         url_for('nlp_recast.memory'),
         content_type='application/json',
@@ -401,12 +490,12 @@ def test_memory_missing_audio_file(mock_recast_send_request_memory, client, reca
     expected_result = {'errors': [dict(MissingParameterException('user_id'))]}
     assert res.status_code == 400
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
-    assert mock_recast_send_request_memory.call_count == 0
+    assert mock_recast_send_request_memory_fields.call_count == 0
 
 
 # Ensure that NLP behaves correctly when field and user id are missing
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_missing_audio_file_and_language(mock_recast_send_request_memory, client):
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_missing_audio_file_and_language(mock_recast_send_request_memory_fields, client):
     res = client.post(
         url_for('nlp_recast.memory'),
         content_type='application/json',
@@ -421,12 +510,12 @@ def test_memory_missing_audio_file_and_language(mock_recast_send_request_memory,
     }
     assert res.status_code == 400
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
-    assert mock_recast_send_request_memory.call_count == 0
+    assert mock_recast_send_request_memory_fields.call_count == 0
 
 
 # Ensure that NLP behaves correctly when json are empty
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_empty_json(mock_recast_send_request_memory, client):
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_empty_json(mock_recast_send_request_memory_fields, client):
     res = client.post(
         url_for('nlp_recast.memory'),
         content_type='application/json',
@@ -440,14 +529,14 @@ def test_memory_empty_json(mock_recast_send_request_memory, client):
     }
     assert res.status_code == 400
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
-    assert mock_recast_send_request_memory.call_count == 0
+    assert mock_recast_send_request_memory_fields.call_count == 0
 
 
 
 # Ensure that NLP behaves correctly when Recast failed to respond
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_recast_not_working(mock_recast_send_request_memory, client, recast_memory_request, recast_memory_response):
-    mock_recast_send_request_memory.side_effect = ExternalAPIException()
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_recast_not_working(mock_recast_send_request_memory_fields, client, recast_memory_request, recast_memory_response):
+    mock_recast_send_request_memory_fields.side_effect = ExternalAPIException()
     res = client.post(
         url_for('nlp_recast.memory'),
         content_type='application/json',
@@ -464,13 +553,13 @@ def test_memory_recast_not_working(mock_recast_send_request_memory, client, reca
     }
     assert res.status_code == 503
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
-    assert mock_recast_send_request_memory.call_count == 1
+    assert mock_recast_send_request_memory_fields.call_count == 1
 
 
 # Ensure that NLP behaves correctly when Recast stopped unexpectedly
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_recast_stopped(mock_recast_send_request_memory, client, recast_memory_request):
-    mock_recast_send_request_memory.side_effect = Exception()
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_recast_stopped(mock_recast_send_request_memory_fields, client, recast_memory_request):
+    mock_recast_send_request_memory_fields.side_effect = Exception()
     res = client.post(
         url_for('nlp_recast.memory'),
         content_type='application/json',
@@ -487,13 +576,13 @@ def test_memory_recast_stopped(mock_recast_send_request_memory, client, recast_m
     }
     assert res.status_code == 500
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
-    assert mock_recast_send_request_memory.call_count == 1
+    assert mock_recast_send_request_memory_fields.call_count == 1
 
 
 # Ensure that NLP behaves correctly when credentials are invalid
-@patch('api.nlp.recast.views.recast_send_request_memory', autospec=True)
-def test_memory_recast_invalid_credentials(mock_recast_send_request_memory, client, recast_memory_request):
-    mock_recast_send_request_memory.side_effect = InvalidCredentialsException(api_name='Recast')
+@patch('api.nlp.recast.views.recast_send_request_memory_fields', autospec=True)
+def test_memory_recast_invalid_credentials(mock_recast_send_request_memory_fields, client, recast_memory_request):
+    mock_recast_send_request_memory_fields.side_effect = InvalidCredentialsException(api_name='Recast')
     res = client.post(
         url_for('nlp_recast.memory'),
         content_type='application/json',
@@ -510,4 +599,4 @@ def test_memory_recast_invalid_credentials(mock_recast_send_request_memory, clie
     }
     assert res.status_code == 401
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
-    assert mock_recast_send_request_memory.call_count == 1
\ No newline at end of file
+    assert mock_recast_send_request_memory_fields.call_count == 1
\ No newline at end of file
@@ -1,15 +1,21 @@
+import json
 import logging
+import os
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 
 from api.exceptions import MissingParameterException, InvalidCredentialsException, \
     BadParameterException, ExternalAPIException, APIException, ResourceNotFoundException
 from api.nlp.recast.constants import LANGUAGES_CODE, SUPPORTED_FIELDS
-from api.nlp.recast.helpers import recast_send_request_dialog, recast_send_request_intent, recast_send_request_memory
+from api.nlp.recast.helpers import recast_send_request_dialog, recast_send_request_intent, \
+    recast_send_request_memory_fields, recast_send_request_intents, clear_intent_cache
 
 nlp_recast = Blueprint('nlp_recast', __name__)
 logger = logging.getLogger(__name__)
 
+# Most texts classified by a single batch request
+INTENT_BATCH_SIZE = int(os.environ.get('INTENT_BATCH_SIZE', '1000'))
+
 
 @nlp_recast.route('/answer', methods=['POST'])
 def answer():
@@ -74,11 +80,49 @@ def intent():
         return jsonify({'errors': errors}), 400
 
 
+@nlp_recast.route('/intent/batch', methods=['POST'])
+def intent_batch():
+    if not request.json:
+        return jsonify({'errors': [dict(APIException('no_content'))]}), 400
+    if 'texts' not in request.json:
+        return jsonify({'errors': [dict(MissingParameterException('texts'))]}), 400
+
+    texts = request.json['texts']
+    if not isinstance(texts, list) or len(texts) > INTENT_BATCH_SIZE or \
+            not all(isinstance(text, str) and text for text in texts):
+        return jsonify({'errors': [dict(BadParameterException('texts'))]}), 400
+    language = request.json.get('language')
+    if language and language not in LANGUAGES_CODE:
+        return jsonify({'errors': [dict(BadParameterException('language', valid_values=LANGUAGES_CODE))]}), 400
+
+    results = (batch_result(res, e) for res, e in recast_send_request_intents(texts, language))
+    if request.json.get('stream'):
+        # One JSON result per line, sent as soon as it is known
+        return Response((json.dumps(result) + '\n' for result in results), mimetype='application/x-ndjson')
+    return jsonify({'results': list(results)}), 200
+
+
+def batch_result(res, e):
+    if e is None:
+        return res['results']
+    if not isinstance(e, (InvalidCredentialsException, ExternalAPIException)):
+        logger.error(e)
+        e = APIException('nlp_intent')
+    return {'errors': [dict(e)]}
+
+
+@nlp_recast.route('/intent/cache', methods=['DELETE'])
+def intent_cache():
+    # Called once the bot is trained: cached intents may have changed
+    clear_intent_cache()
+    return '', 204
+
+
 @nlp_recast.route('/memory', methods=['POST'])
 def memory():
     errors = []
     if request.json:
-        if 'field' not in request.json:
+        if 'field' not in request.json and 'fields' not in request.json:
             errors.append(dict(MissingParameterException('field')))
 
         if 'user_id' not in request.json:
@@ -87,13 +131,18 @@ def memory():
         if errors:
             return jsonify({'errors': errors}), 400
 
-        field = request.json['field']
-        if field not in SUPPORTED_FIELDS:
+        # Several fields can be changed at once with a map of field -> value, a null value deletes the field
+        if 'fields' in request.json:
+            fields = request.json['fields']
+            if not isinstance(fields, dict) or not fields:
+                return jsonify({'errors': [dict(BadParameterException('fields'))]}), 400
+        else:
+            fields = {request.json['field']: request.json.get('value')}
+        if any(field not in SUPPORTED_FIELDS for field in fields):
             return jsonify({'errors': [dict(BadParameterException('field', valid_values=SUPPORTED_FIELDS))]}), 400
-        value = request.json.get('value')
         user_id = request.json['user_id']
         try:
-            res = recast_send_request_memory(field, user_id, value)
+            res = recast_send_request_memory_fields(fields, user_id)
             return jsonify(res['results']), 200
         except InvalidCredentialsException as e:
             return jsonify({'errors': [dict(e)]}), e.status_code
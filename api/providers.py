@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+
+# Factories of the clients and heavy resources of external providers, built on first use
+FACTORIES = {}
+# Instances built so far in the process
+INSTANCES = {}
+lock = threading.RLock()
+# Process which built the instances
+pid = os.getpid()
+
+
+def register(name, factory):
+    """
+    Register how to build a provider. factory is called without argument, at most once per process.
+    """
+    with lock:
+        FACTORIES[name] = factory
+        INSTANCES.pop(name, None)
+
+
+def get(name):
+    check_fork()
+    instance = INSTANCES.get(name)
+    if instance is None:
+        with lock:
+            instance = INSTANCES.get(name)
+            if instance is None:
+                instance = INSTANCES[name] = FACTORIES[name]()
+    return instance
+
+
+def is_loaded(name):
+    check_fork()
+    return name in INSTANCES
+
+
+def check_fork():
+    """
+    Drop the instances inherited from the parent process, e.g. when the app is preloaded by the gunicorn master:
+    gRPC channels are not fork-safe, and the lock may have been held by a thread which doesn't exist anymore.
+    """
+    global pid, lock
+    if pid != os.getpid():
+        pid = os.getpid()
+        lock = threading.RLock()
+        INSTANCES.clear()
+
+
+def reset(name=None):
+    """
+    Drop the built instance of a provider (or of all of them) so it is built again on next use.
+    """
+    with lock:
+        if name is None:
+            INSTANCES.clear()
+        else:
+            INSTANCES.pop(name, None)
+
+
+def credentials_path(provider):
+    return os.getcwd() + '/res/credentials/{}.json'.format(provider)
+
+
+def load_credentials(provider):
+    with open(credentials_path(provider), 'r') as file:
+        return json.load(file)
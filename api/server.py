@@ -1,9 +1,10 @@
-from flask import Flask, redirect, Response
+from flask import Flask, redirect, Response, jsonify
 from flask_swagger_ui import get_swaggerui_blueprint
 from api.speech_to_text.google.views import stt_google
 from api.text_to_speech.ibm.views import tts_ibm
 from api.nlp.recast.views import nlp_recast
 from api.converse.views import converse
+from api.warmup import ready
 
 app = Flask(__name__)
 
@@ -23,3 +24,10 @@ def index():
 def swagger_file():
     content = open('./docs/openapi.yaml', 'r')
     return Response(content, mimetype="text/yaml")
+
+
+@app.route('/ready')
+def readiness():
+    if not ready.is_set():
+        return jsonify({'ready': False}), 503
+    return jsonify({'ready': True}), 200
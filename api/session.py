@@ -0,0 +1,53 @@
+import os
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Number of upstream hosts kept in the pool (Recast, IBM, services API, ...)
+POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '10'))
+# Number of keep-alive connections kept per host, one per worker thread by default
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', os.environ.get('GUNICORN_THREADS', '10')))
+MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '0'))
+
+MAX_AGE_REGEX = re.compile(r'(?:^|,)\s*(s-maxage|max-age)\s*=\s*"?(\d+)"?', re.IGNORECASE)
+
+
+def create_session():
+    """
+    Build a requests session with one keep-alive pool per upstream host.
+    Connections (and so DNS resolution and TLS handshakes) are only paid once per pooled connection.
+    """
+    new_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=MAX_RETRIES)
+    new_session.mount('https://', adapter)
+    new_session.mount('http://', adapter)
+    return new_session
+
+
+# Shared by every helper calling an upstream HTTP API
+session = create_session()
+
+
+def response_ttl(res, default):
+    """
+    Time-to-live in seconds of a response according to its Cache-Control or Expires headers.
+    """
+    cache_control = res.headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    max_ages = dict((name.lower(), int(value)) for name, value in MAX_AGE_REGEX.findall(cache_control))
+    if max_ages:
+        max_age = max_ages.get('s-maxage', max_ages.get('max-age'))
+        return max(max_age - int(res.headers.get('Age', '0') or 0), 0)
+    if res.headers.get('Expires'):
+        try:
+            expires = parsedate_to_datetime(res.headers['Expires']).timestamp()
+            date = parsedate_to_datetime(res.headers['Date']).timestamp() if res.headers.get('Date') else time.time()
+        except (TypeError, ValueError):
+            # Invalid dates mean the response is already expired
+            return 0
+        return max(int(expires - date), 0)
+    return default
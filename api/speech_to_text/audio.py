@@ -0,0 +1,253 @@
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+# Speech recognition doesn't need more than 16kHz
+TARGET_SAMPLE_RATE = 16000
+# Limits of the audio accepted by Google
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+MAX_DURATION = float(os.environ.get('STT_MAX_DURATION', '60'))
+# Long audio is split into segments shorter than Google's limit
+MAX_LONG_DURATION = float(os.environ.get('STT_MAX_LONG_DURATION', '600'))
+SEGMENT_DURATION = float(os.environ.get('STT_SEGMENT_DURATION', '50'))
+
+# Voice activity detection: frames louder than the threshold (in dBFS) contain voice
+VAD_FRAME_DURATION = 0.02
+VAD_THRESHOLD = float(os.environ.get('VAD_THRESHOLD', '-40'))
+# Minimum duration of voice (in seconds) for the audio not to be considered silent
+VAD_MIN_VOICE_DURATION = float(os.environ.get('VAD_MIN_VOICE_DURATION', '0.1'))
+# Silence kept around the voice (in seconds) when trimming
+VAD_PADDING = float(os.environ.get('VAD_PADDING', '0.2'))
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample rates accepted by Google for Ogg Opus audio
+OPUS_SAMPLE_RATES = [8000, 12000, 16000, 24000, 48000]
+# Opus is always decoded at 48kHz
+OPUS_GRANULE_RATE = 48000
+
+WavHeader = namedtuple('WavHeader', ['channels', 'sample_width', 'sample_rate', 'data_offset', 'data_size', 'duration'])
+# Compressed audio is sent as it is to Google, with its encoding
+CompressedHeader = namedtuple('CompressedHeader', ['encoding', 'channels', 'sample_rate', 'duration'])
+
+
+class InvalidAudioError(ValueError):
+    pass
+
+
+class SilentAudioError(Exception):
+    pass
+
+
+def read_wav_header(content, max_duration=MAX_DURATION, partial=False):
+    """
+    Read and check the header of WAV content, without decoding it.
+    partial allows the content to be only the beginning of the audio, e.g. while it is uploaded.
+    """
+    if len(content) < 12 or content[:4] != b'RIFF' or content[8:12] != b'WAVE':
+        raise InvalidAudioError('Not a WAV file')
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(content):
+        chunk_id, size = struct.unpack_from('<4sI', content, offset)
+        offset += 8
+        if chunk_id == b'fmt ':
+            if size < 16 or offset + size > len(content):
+                raise InvalidAudioError('Invalid fmt chunk')
+            format_tag, channels, sample_rate, _, block_align, bits = struct.unpack_from('<HHIIHH', content, offset)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                # The actual format is the beginning of the sub-format GUID
+                format_tag = struct.unpack_from('<H', content, offset + 24)[0]
+            if format_tag != WAVE_FORMAT_PCM:
+                raise InvalidAudioError('Unsupported format: {}'.format(format_tag))
+            if bits not in (8, 16, 24, 32) or channels < 1 or block_align != channels * bits // 8:
+                raise InvalidAudioError('Unsupported samples: {} channels of {} bits'.format(channels, bits))
+            if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+                raise InvalidAudioError('Unsupported sample rate: {}'.format(sample_rate))
+            fmt = channels, bits // 8, sample_rate
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise InvalidAudioError('Missing fmt chunk')
+            channels, sample_width, sample_rate = fmt
+            if size == 0 and not partial:
+                # Streamed or piped audio whose size wasn't known when the header was written
+                size = len(content) - offset
+            # Truncated audio, or its size isn't known yet
+            data_size = min(size, len(content) - offset)
+            data_size -= data_size % (channels * sample_width)
+            duration = data_size / (channels * sample_width * sample_rate)
+            if not partial and data_size == 0:
+                raise InvalidAudioError('Empty audio')
+            if max_duration and duration > max_duration:
+                raise InvalidAudioError('Audio is longer than {}s'.format(max_duration))
+            return WavHeader(channels, sample_width, sample_rate, offset, data_size, duration)
+        offset += size + size % 2
+    raise InvalidAudioError('Missing data chunk')
+
+
+def read_compressed_header(content, max_duration=MAX_DURATION):
+    """
+    Read and check the header of FLAC or Ogg Opus content.
+    Returns None if the content isn't compressed audio.
+    """
+    if content[:4] == b'fLaC':
+        header = read_flac_header(content)
+    elif content[:4] == b'OggS':
+        header = read_ogg_opus_header(content)
+    else:
+        return None
+    if max_duration and header.duration > max_duration:
+        raise InvalidAudioError('Audio is longer than {}s'.format(max_duration))
+    return header
+
+
+def read_flac_header(content):
+    # The STREAMINFO metadata block always comes first
+    if len(content) < 42 or content[4] & 0x7F != 0:
+        raise InvalidAudioError('Invalid FLAC header')
+    info = int.from_bytes(content[18:26], 'big')
+    sample_rate = info >> 44
+    channels = (info >> 41 & 0x07) + 1
+    total_samples = info & 0xFFFFFFFFF
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise InvalidAudioError('Unsupported sample rate: {}'.format(sample_rate))
+    # The number of samples may be unknown (0)
+    return CompressedHeader('FLAC', channels, sample_rate, total_samples / sample_rate)
+
+
+def read_ogg_opus_header(content):
+    # The first page only contains the OpusHead packet
+    if len(content) < 28:
+        raise InvalidAudioError('Invalid Ogg header')
+    packet = 27 + content[26]
+    if content[packet:packet + 8] != b'OpusHead' or len(content) < packet + 16:
+        raise InvalidAudioError('Unsupported Ogg codec')
+    channels = content[packet + 9]
+    pre_skip, input_sample_rate = struct.unpack_from('<HI', content, packet + 10)
+    sample_rate = input_sample_rate if input_sample_rate in OPUS_SAMPLE_RATES else OPUS_GRANULE_RATE
+    # The granule position of the last page is the number of samples at 48kHz
+    last_page = content.rfind(b'OggS\x00')
+    granule_position = struct.unpack_from('<q', content, last_page + 6)[0] if last_page + 14 <= len(content) else 0
+    duration = max(granule_position - pre_skip, 0) / OPUS_GRANULE_RATE
+    return CompressedHeader('OGG_OPUS', channels, sample_rate, duration)
+
+
+def decode_wav(content, max_duration=MAX_DURATION):
+    """
+    Decode WAV content into an array of float samples (one column per channel) and its sample rate.
+    """
+    header = read_wav_header(content, max_duration)
+    data = content[header.data_offset:header.data_offset + header.data_size]
+
+    if header.sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) * 256
+    elif header.sample_width == 2:
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32)
+    elif header.sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((raw[:, 0] << 8 | raw[:, 1] << 16 | raw[:, 2] << 24) >> 16).astype(np.float32)
+    else:
+        samples = (np.frombuffer(data, dtype='<i4') >> 16).astype(np.float32)
+    return samples.reshape(-1, header.channels), header.sample_rate
+
+
+def downmix(samples):
+    return samples.mean(axis=1)
+
+
+def resample(samples, sample_rate, target_sample_rate):
+    if sample_rate <= target_sample_rate or len(samples) == 0:
+        return samples
+    positions = np.arange(int(len(samples) * target_sample_rate / sample_rate)) * (sample_rate / target_sample_rate)
+    # Moving average as low-pass filter, to avoid aliasing of the frequencies above the new Nyquist frequency
+    width = int(round(sample_rate / target_sample_rate))
+    if width > 1:
+        cumsum = np.cumsum(np.concatenate(([0], samples)))
+        samples = (cumsum[width:] - cumsum[:-width]) / width
+    return np.interp(positions, np.arange(len(samples)), samples)
+
+
+def encode_linear16(samples):
+    return np.clip(np.round(samples), -32768, 32767).astype('<i2').tobytes()
+
+
+def frame_energies(samples, sample_rate):
+    """
+    Energy (in dBFS) of each frame of the samples, with the length of the frames.
+    """
+    frame_length = max(int(sample_rate * VAD_FRAME_DURATION), 1)
+    count = len(samples) // frame_length
+    frames = samples[:count * frame_length].reshape(count, frame_length)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1) / 32768), frame_length
+
+
+def voiced_range(samples, sample_rate):
+    """
+    Start and end of the voiced part of the samples, or None if they are silent.
+    """
+    energies, frame_length = frame_energies(samples, sample_rate)
+    voiced = np.flatnonzero(energies > VAD_THRESHOLD)
+    if len(voiced) * frame_length < VAD_MIN_VOICE_DURATION * sample_rate:
+        return None
+    padding = int(VAD_PADDING * sample_rate)
+    return max(voiced[0] * frame_length - padding, 0), min((voiced[-1] + 1) * frame_length + padding, len(samples))
+
+
+def split_on_silence(samples, sample_rate, max_duration):
+    """
+    Split the samples into (start, end) segments shorter than max_duration.
+    Each segment is cut at the quietest frame of its second half, so words are not cut in the middle.
+    """
+    energies, frame_length = frame_energies(samples, sample_rate)
+    max_frames = max(int(max_duration * sample_rate) // frame_length, 2)
+    segments = []
+    start = 0
+    while len(energies) - start > max_frames:
+        window_start = start + max_frames // 2
+        cut = window_start + int(np.argmin(energies[window_start:start + max_frames]))
+        segments.append((start * frame_length, cut * frame_length))
+        start = cut
+    segments.append((start * frame_length, len(samples)))
+    return segments
+
+
+def load_samples(content, target_sample_rate, max_duration):
+    samples, sample_rate = decode_wav(content, max_duration)
+    samples = resample(downmix(samples), sample_rate, target_sample_rate)
+    return samples, min(sample_rate, target_sample_rate)
+
+
+def prepare_audio(content, target_sample_rate=TARGET_SAMPLE_RATE, max_duration=MAX_DURATION):
+    """
+    Convert WAV content into mono LINEAR16 audio (without header) at most at the target sample rate,
+    without its leading and trailing silence.
+    Returns the audio and its sample rate, raises InvalidAudioError if it isn't a valid WAV
+    and SilentAudioError if it only contains silence.
+    """
+    samples, sample_rate = load_samples(content, target_sample_rate, max_duration)
+    voiced = voiced_range(samples, sample_rate)
+    if voiced is None:
+        raise SilentAudioError()
+    return encode_linear16(samples[voiced[0]:voiced[1]]), sample_rate
+
+
+def prepare_audio_segments(content, segment_duration=SEGMENT_DURATION, target_sample_rate=TARGET_SAMPLE_RATE,
+                           max_duration=MAX_LONG_DURATION):
+    """
+    Same as prepare_audio, but the audio is split at silences into LINEAR16 segments shorter than segment_duration.
+    Silent segments are dropped. Returns the segments in order and their sample rate.
+    """
+    samples, sample_rate = load_samples(content, target_sample_rate, max_duration)
+    segments = []
+    for start, end in split_on_silence(samples, sample_rate, segment_duration):
+        voiced = voiced_range(samples[start:end], sample_rate)
+        if voiced is not None:
+            segments.append(encode_linear16(samples[start + voiced[0]:start + voiced[1]]))
+    if not segments:
+        raise SilentAudioError()
+    return segments, sample_rate
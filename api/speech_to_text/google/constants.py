@@ -1,3 +1,5 @@
+from api.speech_to_text.audio import MAX_DURATION
+
 LANGUAGES_CODE = [
     'en-US',
     'fr-FR'
@@ -6,3 +8,11 @@ SIMPLIFIED_LANGUAGES_CODE = {
     'fr-FR': 'fr',
     'en-US': 'en'
 }
+
+# Size of the audio chunks sent to Google while they are uploaded
+STREAM_CHUNK_SIZE = 32 * 1024
+
+# Accepted audio formats, given when the uploaded audio isn't valid
+AUDIO_REQUIREMENTS = ['PCM WAV (8 to 32 bits, 8 to 48kHz)', 'Mono FLAC', 'Mono Ogg Opus', '<{:g}s'.format(MAX_DURATION)]
+# Streamed audio is forwarded as it is to Google
+STREAM_AUDIO_REQUIREMENTS = ['PCM WAV', '16 bits', 'Mono', '8 to 48kHz']
@@ -1,27 +1,209 @@
 import os
-from google.cloud.speech import SpeechClient, enums, types
-from google.gax.errors import RetryError
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from api import providers
+from api.channels import ClientPool
+from api.cache import ExpiringCache, content_key
+from api.concurrency import SingleFlight
 from api.exceptions import OperationFailedException, BadParameterException
+from api.speech_to_text.audio import prepare_audio, prepare_audio_segments, read_wav_header, read_compressed_header, \
+    InvalidAudioError, SilentAudioError
+from api.speech_to_text.google.constants import AUDIO_REQUIREMENTS, STREAM_AUDIO_REQUIREMENTS
 
-os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = './res/credentials/google.json'
-speech_client = SpeechClient()
+# Segments of long audio recognized at the same time, shared by every request of the worker
+STT_LONG_CONCURRENCY = int(os.environ.get('STT_LONG_CONCURRENCY', '4'))
+recognition_pool = ThreadPoolExecutor(max_workers=STT_LONG_CONCURRENCY)
+
+# Recognition results of identical audio (e.g. retried uploads), keyed on the normalized audio and language
+STT_CACHE_TTL = int(os.environ.get('STT_CACHE_TTL', '3600'))
+STT_CACHE_SIZE = int(os.environ.get('STT_CACHE_SIZE', '1024'))
+recognition_cache = ExpiringCache(maxsize=STT_CACHE_SIZE)
+recognition_flight = SingleFlight()
+
+# Number of gRPC channels (HTTP/2 connections) to Google opened by each worker
+STT_GRPC_CHANNELS = int(os.environ.get('STT_GRPC_CHANNELS', '1'))
+
+
+def create_speech_clients():
+    # google.cloud.speech is slow to import: it is only imported with the first recognition
+    from google.cloud.speech import SpeechClient
+    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = providers.credentials_path('google')
+    scopes = getattr(SpeechClient, '_DEFAULT_SCOPES', ['https://www.googleapis.com/auth/cloud-platform'])
+    return ClientPool(lambda channel: SpeechClient(channel=channel), SpeechClient.SERVICE_ADDRESS, scopes,
+                      STT_GRPC_CHANNELS)
+
+
+# Built by each worker on first use, after the fork
+providers.register('google_speech', create_speech_clients)
+
+
+def get_speech_client():
+    return providers.get('google_speech').get()
 
 
 def google_speech_send_request(content, language):
+    from google.cloud.speech import enums
+    try:
+        compressed = read_compressed_header(content)
+        if compressed:
+            # FLAC and Ogg Opus are sent as they are: Google only recognizes them when they are mono
+            if compressed.channels != 1:
+                raise InvalidAudioError('Unsupported compressed audio: {} channels'.format(compressed.channels))
+            encoding = getattr(enums.RecognitionConfig.AudioEncoding, compressed.encoding)
+            sample_rate = compressed.sample_rate
+        else:
+            # Mono 16kHz without silence is enough for recognition and much lighter to upload
+            encoding = enums.RecognitionConfig.AudioEncoding.LINEAR16
+            content, sample_rate = prepare_audio(content)
+    except InvalidAudioError as e:
+        print('{} : {}'.format(type(e).__name__, e))
+        raise BadParameterException('audio', AUDIO_REQUIREMENTS)
+    except SilentAudioError as e:
+        # Nothing to recognize: Google would not return any result
+        raise OperationFailedException from e
+    # Audio is hashed once normalized, so the same upload always has the same key
+    key = content_key(content, encoding, sample_rate, language)
+    return dict(recognition_cache.get_or_load(key, lambda: recognition_flight.do(
+        key, recognize, content, encoding, sample_rate, language
+    )))
+
+
+def recognize(content, encoding, sample_rate, language):
+    from google.cloud.speech import types
+    from google.gax.errors import RetryError
     audio = types.RecognitionAudio(content=content)
     config = types.RecognitionConfig(
-        encoding=enums.RecognitionConfig.AudioEncoding.LINEAR16,
+        encoding=encoding,
+        sample_rate_hertz=sample_rate,
         language_code=language
     )
     try:
-        response = speech_client.recognize(config, audio)
+        response = get_speech_client().recognize(config, audio)
 
         return {
             'text': response.results[0].alternatives[0].transcript,
             'confidence': round(float(response.results[0].alternatives[0].confidence), 4)
+        }, STT_CACHE_TTL
+    except RetryError as e:
+        print('{} : {}'.format(type(e).__name__, e))
+        raise BadParameterException('audio', AUDIO_REQUIREMENTS)
+    except Exception as e:
+        raise OperationFailedException from e
+
+
+def google_speech_send_long_request(content, language):
+    """
+    Recognize audio longer than what Google accepts at once.
+    The audio is split at silences and its segments are recognized concurrently, then their transcripts are joined.
+    """
+    try:
+        if read_compressed_header(content) is not None:
+            # Compressed audio can't be split without decoding it
+            return google_speech_send_request(content, language)
+        segments, sample_rate = prepare_audio_segments(content)
+    except InvalidAudioError as e:
+        print('{} : {}'.format(type(e).__name__, e))
+        raise BadParameterException('audio', AUDIO_REQUIREMENTS)
+    except SilentAudioError as e:
+        raise OperationFailedException from e
+    key = content_key(*segments, sample_rate, language)
+    return dict(recognition_cache.get_or_load(key, lambda: recognition_flight.do(
+        key, recognize_segments, segments, sample_rate, language
+    )))
+
+
+def recognize_segments(segments, sample_rate, language):
+    from google.cloud.speech import enums, types
+    from google.gax.errors import RetryError
+    config = types.RecognitionConfig(
+        encoding=enums.RecognitionConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=sample_rate,
+        language_code=language
+    )
+
+    speech_client = get_speech_client()
+
+    def recognize_segment(segment):
+        return speech_client.recognize(config, types.RecognitionAudio(content=segment))
+
+    try:
+        # map keeps the order of the segments
+        responses = list(recognition_pool.map(recognize_segment, segments))
+    except RetryError as e:
+        print('{} : {}'.format(type(e).__name__, e))
+        raise BadParameterException('audio', AUDIO_REQUIREMENTS)
+    except Exception as e:
+        raise OperationFailedException from e
+
+    transcripts = []
+    confidence = 0
+    duration = 0
+    for segment, response in zip(segments, responses):
+        alternatives = [result.alternatives[0] for result in response.results]
+        if not alternatives:
+            continue
+        transcripts.extend(alternative.transcript.strip() for alternative in alternatives)
+        # Longer segments weigh more in the confidence of the whole audio
+        segment_confidence = sum(float(alternative.confidence) for alternative in alternatives) / len(alternatives)
+        confidence += len(segment) * segment_confidence
+        duration += len(segment)
+    if not transcripts:
+        raise OperationFailedException()
+
+    return {
+        'text': ' '.join(transcripts),
+        'confidence': round(confidence / duration, 4)
+    }, STT_CACHE_TTL
+
+
+def google_speech_send_stream(chunks, language, interim_results=False):
+    """
+    Recognize the audio chunks while they are received.
+    """
+    from google.cloud.speech import enums, types
+    from google.gax.errors import RetryError
+    chunks = iter(chunks)
+    first_chunk = next(chunks, b'')
+    try:
+        header = read_wav_header(first_chunk, max_duration=None, partial=True)
+    except InvalidAudioError as e:
+        print('{} : {}'.format(type(e).__name__, e))
+        raise BadParameterException('audio', STREAM_AUDIO_REQUIREMENTS)
+    # Chunks are forwarded as they are: they must already be LINEAR16
+    if header.channels != 1 or header.sample_width != 2:
+        raise BadParameterException('audio', STREAM_AUDIO_REQUIREMENTS)
+
+    config = types.StreamingRecognitionConfig(
+        config=types.RecognitionConfig(
+            encoding=enums.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=header.sample_rate,
+            language_code=language
+        ),
+        interim_results=interim_results
+    )
+    chunks = chain([first_chunk[header.data_offset:]], chunks)
+    requests = (types.StreamingRecognizeRequest(audio_content=chunk) for chunk in chunks)
+    try:
+        transcripts = []
+        confidences = []
+        interims = []
+        for response in get_speech_client().streaming_recognize(config, requests):
+            for result in response.results:
+                if result.is_final:
+                    transcripts.append(result.alternatives[0].transcript.strip())
+                    confidences.append(float(result.alternatives[0].confidence))
+                else:
+                    interims.append(result.alternatives[0].transcript)
+
+        res = {
+            'text': ' '.join(transcripts),
+            'confidence': round(sum(confidences) / len(confidences), 4)
         }
+        if interim_results:
+            res['interim'] = interims
+        return res
     except RetryError as e:
         print('{} : {}'.format(type(e).__name__, e))
-        raise BadParameterException('audio', ['WAV', '16 bits', 'Mono', '44100Hz', '<1min'])
+        raise BadParameterException('audio', AUDIO_REQUIREMENTS)
     except Exception as e:
         raise OperationFailedException from e
@@ -1,6 +1,8 @@
 import pytest
 import os
 import io
+import wave
+import numpy as np
 from mock import Mock
 
 
@@ -33,3 +35,51 @@ def result():
 @pytest.fixture()
 def google_response(result):
     return Mock(results=[Mock(alternatives=[Mock(transcript=result['text'], confidence=result['confidence'])])])
+
+
+@pytest.fixture()
+def google_stream_responses():
+    return [
+        Mock(results=[Mock(is_final=False, alternatives=[Mock(transcript='Bonjour', confidence=0)])]),
+        Mock(results=[Mock(is_final=True, alternatives=[Mock(transcript='Bonjour', confidence=0.95)])]),
+        Mock(results=[Mock(is_final=True, alternatives=[Mock(transcript=' comment tu vas', confidence=0.85)])])
+    ]
+
+
+@pytest.fixture()
+def silent_audio():
+    content = io.BytesIO()
+    with wave.open(content, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(44100)
+        wav.writeframes(b'\x00\x00' * 44100)
+    return content.getvalue()
+
+
+@pytest.fixture()
+def flac_audio():
+    info = 16000 << 44 | 15 << 36 | 16000 * 2
+    return b'fLaC' + b'\x80\x00\x00\x22' + b'\x00' * 10 + info.to_bytes(8, 'big') + b'\x00' * 16 + b'frames'
+
+
+@pytest.fixture()
+def stereo_flac_audio():
+    info = 16000 << 44 | 1 << 41 | 15 << 36 | 16000 * 2
+    return b'fLaC' + b'\x80\x00\x00\x22' + b'\x00' * 10 + info.to_bytes(8, 'big') + b'\x00' * 16 + b'frames'
+
+
+@pytest.fixture()
+def long_audio():
+    # Tones of 40s, 30s and 20s separated by 1s pauses
+    parts = []
+    for duration in (40, 30, 20):
+        parts.append(10000 * np.sin(2 * np.pi * 440 * np.arange(duration * 16000) / 16000))
+        parts.append(np.zeros(16000))
+    content = io.BytesIO()
+    with wave.open(content, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(np.concatenate(parts[:-1]).astype('<i2').tobytes())
+    return content.getvalue()
@@ -1,7 +1,10 @@
 import pytest
-from mock import patch
-from api.exceptions import OperationFailedException
-from api.speech_to_text.google.helpers import google_speech_send_request, SpeechClient
+from mock import patch, Mock
+from google.cloud.speech import SpeechClient, enums
+from google.gax.errors import RetryError
+from api.exceptions import OperationFailedException, BadParameterException
+from api.speech_to_text.google.helpers import google_speech_send_request, google_speech_send_long_request, \
+    google_speech_send_stream
 
 
 # Ensure that STT behaves correctly
@@ -15,6 +18,63 @@ def test_google_speech_send_request(mock_speech_client, google_request, google_r
     assert google_response.results[0].alternatives[0].confidence == res['confidence']
 
 
+# Ensure that STT results of identical audio are cached
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_google_speech_send_request_cached(mock_speech_client, google_request, google_response, result):
+    mock_speech_client.side_effect = [Exception(), google_response, google_response]
+    # Failures aren't cached
+    with pytest.raises(OperationFailedException):
+        google_speech_send_request(google_request['file'], google_request['language'])
+
+    assert google_speech_send_request(google_request['file'], google_request['language']) == result
+    assert google_speech_send_request(google_request['file'], google_request['language']) == result
+    assert mock_speech_client.call_count == 2
+
+    google_speech_send_request(google_request['file'], 'en-US')
+    assert mock_speech_client.call_count == 3
+
+
+# Ensure that STT sends mono 16kHz audio to Google
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_google_speech_send_request_resampled(mock_speech_client, google_request, google_response):
+    mock_speech_client.return_value = google_response
+    google_speech_send_request(google_request['file'], google_request['language'])
+
+    client, config, audio = mock_speech_client.call_args[0]
+    assert config.sample_rate_hertz == 16000
+    assert len(audio.content) < len(google_request['file']) / 2
+
+
+# Ensure that STT sends compressed audio as it is to Google
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_google_speech_send_request_flac(mock_speech_client, google_request, google_response, flac_audio):
+    mock_speech_client.return_value = google_response
+    google_speech_send_request(flac_audio, google_request['language'])
+
+    client, config, audio = mock_speech_client.call_args[0]
+    assert config.encoding == enums.RecognitionConfig.AudioEncoding.FLAC
+    assert config.sample_rate_hertz == 16000
+    assert audio.content == flac_audio
+
+
+# Ensure that STT rejects compressed audio which isn't mono, Google wouldn't recognize it
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_google_speech_send_request_stereo_flac(mock_speech_client, google_request, stereo_flac_audio):
+    with pytest.raises(BadParameterException):
+        google_speech_send_request(stereo_flac_audio, google_request['language'])
+    with pytest.raises(BadParameterException):
+        google_speech_send_long_request(stereo_flac_audio, google_request['language'])
+    assert mock_speech_client.call_count == 0
+
+
+# Ensure that STT doesn't send silent audio to Google
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_google_speech_send_request_silent(mock_speech_client, google_request, silent_audio):
+    with pytest.raises(OperationFailedException):
+        google_speech_send_request(silent_audio, google_request['language'])
+    assert mock_speech_client.call_count == 0
+
+
 # Ensure that STT behave correctly when SpeechClient is not working properly
 @patch.object(SpeechClient, 'recognize', autospec=True)
 def test_google_speech_client_failed(mock_speech_client, google_request, google_response):
@@ -23,9 +83,79 @@ def test_google_speech_client_failed(mock_speech_client, google_request, google_
         google_speech_send_request(google_request['file'], google_request['language'])
 
 
+# Ensure that long STT recognizes the segments and joins their transcripts in order
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_google_speech_send_long_request(mock_speech_client, google_request, long_audio):
+    def side_effect(client, config, audio):
+        # Transcript is the duration of the segment, confidence depends on it
+        duration = round(len(audio.content) / 2 / config.sample_rate_hertz)
+        alternative = Mock(transcript=' {}'.format(duration), confidence=duration / 100)
+        return Mock(results=[Mock(alternatives=[alternative])])
+
+    mock_speech_client.side_effect = side_effect
+    res = google_speech_send_long_request(long_audio, google_request['language'])
+
+    assert mock_speech_client.call_count == 3
+    assert res['text'] == '40 30 20'
+    assert 0.3 < res['confidence'] < 0.4
+    for call in mock_speech_client.call_args_list:
+        client, config, audio = call[0]
+        assert config.encoding == enums.RecognitionConfig.AudioEncoding.LINEAR16
+        assert len(audio.content) / 2 / config.sample_rate_hertz < 50
+
+
+# Ensure that long STT behaves correctly when a segment fails or nothing is recognized
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_google_speech_send_long_request_failed(mock_speech_client, google_request, long_audio, corrupted_audio):
+    mock_speech_client.side_effect = [Mock(results=[]), RetryError('mock'), Mock(results=[])]
+    with pytest.raises(BadParameterException):
+        google_speech_send_long_request(long_audio, google_request['language'])
+
+    mock_speech_client.side_effect = None
+    mock_speech_client.return_value = Mock(results=[])
+    with pytest.raises(OperationFailedException):
+        google_speech_send_long_request(long_audio, google_request['language'])
+
+    with pytest.raises(BadParameterException):
+        google_speech_send_long_request(corrupted_audio, google_request['language'])
+
+
 @pytest.mark.externalapi
 def test_service_available(google_request, result):
     res = google_speech_send_request(google_request['file'], google_request['language'])
 
     assert res['text'] == result['text']
     assert res['confidence'] == result['confidence']
+
+
+# Ensure that streaming STT sends the chunks and gathers the final transcripts
+@patch.object(SpeechClient, 'streaming_recognize', autospec=True)
+def test_google_speech_send_stream(mock_streaming_recognize, google_request, google_stream_responses):
+    def side_effect(client, config, requests):
+        assert len(list(requests)) == 2
+        return google_stream_responses
+
+    mock_streaming_recognize.side_effect = side_effect
+    content = google_request['file']
+    res = google_speech_send_stream([content[:1024], content[1024:]], google_request['language'], True)
+
+    assert mock_streaming_recognize.call_count == 1
+    assert res == {'text': 'Bonjour comment tu vas', 'confidence': 0.9, 'interim': ['Bonjour']}
+
+
+# Ensure that streaming STT behaves correctly when nothing is recognized
+@patch.object(SpeechClient, 'streaming_recognize', autospec=True)
+def test_google_speech_send_stream_failed(mock_streaming_recognize, google_request):
+    mock_streaming_recognize.return_value = []
+    with pytest.raises(OperationFailedException):
+        google_speech_send_stream([google_request['file']], google_request['language'])
+
+
+# Ensure that streaming STT rejects audio which can't be forwarded as is
+@patch.object(SpeechClient, 'streaming_recognize', autospec=True)
+def test_google_speech_send_stream_bad_audio(mock_streaming_recognize, google_request, corrupted_audio):
+    with pytest.raises(BadParameterException):
+        google_speech_send_stream([corrupted_audio], google_request['language'])
+    with pytest.raises(BadParameterException):
+        google_speech_send_stream([], google_request['language'])
+    assert mock_streaming_recognize.call_count == 0
@@ -2,12 +2,12 @@ import io
 import json
 
 from flask import url_for
+from google.cloud.speech import SpeechClient
 from google.gax.errors import RetryError
 from mock import patch
 
 from api.exceptions import BadParameterException, MissingParameterException, OperationFailedException
-from api.speech_to_text.google.constants import LANGUAGES_CODE
-from api.speech_to_text.google.helpers import SpeechClient
+from api.speech_to_text.google.constants import LANGUAGES_CODE, AUDIO_REQUIREMENTS
 
 
 # Ensure that STT behaves correctly when provided correct information
@@ -29,6 +29,29 @@ def test_recognize_success(mock_google_speech_send_request, client, google_reque
     assert mock_google_speech_send_request.call_count == 1
 
 
+# Ensure that STT splits the audio in long mode
+@patch('api.speech_to_text.google.views.google_speech_send_request', autospec=True)
+@patch('api.speech_to_text.google.views.google_speech_send_long_request', autospec=True)
+def test_recognize_long_success(mock_google_speech_send_long_request, mock_google_speech_send_request, client,
+                                google_request, result):
+    mock_google_speech_send_long_request.return_value = result
+
+    res = client.post(
+        url_for('stt_google.recognize'),
+        content_type='multipart/form-data',
+        data={
+            'language': google_request['language'],
+            'mode': 'long',
+            'audio': (io.BytesIO(google_request['file']), 'audio.wav')
+        }
+    )
+
+    assert res.status_code == 200
+    assert sorted(json.loads(res.data).items()) == sorted(result.items())
+    assert mock_google_speech_send_long_request.call_count == 1
+    assert mock_google_speech_send_request.call_count == 0
+
+
 # Ensure that STT behaves correctly when provided bad language
 @patch('api.speech_to_text.google.views.google_speech_send_request', autospec=True)
 def test_recognize_bad_language(mock_google_speech_send_request, client, google_request):
@@ -131,7 +154,6 @@ def test_recognize_ibm_not_working(mock_google_speech_send_request, google_reque
 # Ensure that STT behaves correctly when audio file is incorrect
 @patch.object(SpeechClient, 'recognize', autospec=True)
 def test_recognize_audio_corrupted(mock_recognize, google_request, client, corrupted_audio):
-    mock_recognize.side_effect = RetryError('mock')
     res = client.post(
         url_for('stt_google.recognize'),
         content_type='multipart/form-data',
@@ -142,10 +164,70 @@ def test_recognize_audio_corrupted(mock_recognize, google_request, client, corru
     )
     expected_result = {
         'errors': [
-            dict(BadParameterException('audio', ['WAV', '16 bits', 'Mono', '44100Hz', '<1min']))
+            dict(BadParameterException('audio', ['PCM WAV (8 to 32 bits, 8 to 48kHz)', 'Mono FLAC', 'Mono Ogg Opus',
+                                                 '<60s']))
         ]
     }
     assert res.status_code == 422
     assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
+    assert mock_recognize.call_count == 0
+
+
+# Ensure that STT behaves correctly when Google rejects the audio
+@patch.object(SpeechClient, 'recognize', autospec=True)
+def test_recognize_audio_rejected(mock_recognize, google_request, client):
+    mock_recognize.side_effect = RetryError('mock')
+    res = client.post(
+        url_for('stt_google.recognize'),
+        content_type='multipart/form-data',
+        data={
+            'language': google_request['language'],
+            'audio': (io.BytesIO(google_request['file']), 'audio.wav')
+        }
+    )
+    expected_result = {'errors': [dict(BadParameterException('audio', AUDIO_REQUIREMENTS))]}
+    assert res.status_code == 422
+    assert sorted(json.loads(res.data).items()) == sorted(expected_result.items())
     assert mock_recognize.call_count == 1
 
+
+# Ensure that streaming STT behaves correctly when provided correct information
+@patch('api.speech_to_text.google.views.google_speech_send_stream', autospec=True)
+def test_recognize_stream_success(mock_google_speech_send_stream, client, google_request, result):
+    def side_effect(chunks, language, interim_results):
+        assert b''.join(chunks) == google_request['file']
+        assert language == google_request['language']
+        assert interim_results
+        return result
+
+    mock_google_speech_send_stream.side_effect = side_effect
+    res = client.post(
+        url_for('stt_google.recognize_stream', language=google_request['language'], interim=1),
+        content_type='audio/wav',
+        data=google_request['file']
+    )
+
+    assert res.status_code == 200
+    assert sorted(json.loads(res.data).items()) == sorted(result.items())
+    assert mock_google_speech_send_stream.call_count == 1
+
+
+# Ensure that streaming STT behaves correctly when language is missing or not correct
+@patch('api.speech_to_text.google.views.google_speech_send_stream', autospec=True)
+def test_recognize_stream_bad_language(mock_google_speech_send_stream, client, google_request):
+    res = client.post(
+        url_for('stt_google.recognize_stream'),
+        content_type='audio/wav',
+        data=google_request['file']
+    )
+    assert res.status_code == 400
+    assert json.loads(res.data) == {'errors': [dict(MissingParameterException('language'))]}
+
+    res = client.post(
+        url_for('stt_google.recognize_stream', language='xx-XX'),
+        content_type='audio/wav',
+        data=google_request['file']
+    )
+    assert res.status_code == 400
+    assert json.loads(res.data) == {'errors': [dict(BadParameterException('language', valid_values=LANGUAGES_CODE))]}
+    assert mock_google_speech_send_stream.call_count == 0
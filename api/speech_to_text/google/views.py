@@ -3,8 +3,9 @@ from flask import request, jsonify, Blueprint
 
 from api.exceptions import OperationFailedException, MissingParameterException, \
     BadParameterException, ExternalAPIException
-from api.speech_to_text.google.helpers import google_speech_send_request
-from api.speech_to_text.google.constants import LANGUAGES_CODE
+from api.speech_to_text.google.helpers import google_speech_send_request, google_speech_send_long_request, \
+    google_speech_send_stream
+from api.speech_to_text.google.constants import LANGUAGES_CODE, STREAM_CHUNK_SIZE
 
 
 stt_google = Blueprint('stt_google', __name__)
@@ -28,10 +29,49 @@ def recognize():
     if language not in LANGUAGES_CODE:
         return jsonify({'errors': [dict(BadParameterException('language', valid_values=LANGUAGES_CODE))]}), 400
 
+    # Audio longer than a minute is split and its segments recognized concurrently
+    long_audio = request.form.get('mode') == 'long'
+
+    try:
+        if long_audio:
+            res = google_speech_send_long_request(file_content, language)
+        else:
+            res = google_speech_send_request(file_content, language)
+    except (OperationFailedException, BadParameterException) as e:
+        logger.error(e)
+        return jsonify({'errors': [dict(e)]}), e.status_code
+
+    return jsonify(res), 200
+
+
+@stt_google.route('/recognize/stream', methods=['POST'])
+def recognize_stream():
+    language = request.args.get('language')
+    if not language:
+        return jsonify({'errors': [dict(MissingParameterException('language'))]}), 400
+    if language not in LANGUAGES_CODE:
+        return jsonify({'errors': [dict(BadParameterException('language', valid_values=LANGUAGES_CODE))]}), 400
+    interim_results = request.args.get('interim') in ('1', 'true')
+
     try:
-        res = google_speech_send_request(file_content, language)
+        res = google_speech_send_stream(read_chunks(get_audio_stream(request)), language, interim_results)
     except (OperationFailedException, BadParameterException) as e:
         logger.error(e)
         return jsonify({'errors': [dict(e)]}), e.status_code
 
     return jsonify(res), 200
+
+
+def get_audio_stream(req):
+    if 'chunked' in req.headers.get('Transfer-Encoding', '').lower():
+        # The WSGI server decodes chunked bodies, but without Content-Length Werkzeug would consider them empty
+        return req.environ['wsgi.input']
+    return req.stream
+
+
+def read_chunks(stream):
+    while True:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,240 @@
+import io
+import os
+import struct
+import wave
+
+import numpy as np
+import pytest
+
+from api.speech_to_text.audio import decode_wav, downmix, resample, encode_linear16, prepare_audio, voiced_range, \
+    read_wav_header, read_compressed_header, split_on_silence, prepare_audio_segments, InvalidAudioError, \
+    SilentAudioError
+
+
+def make_wav(samples, sample_rate, width=2):
+    content = io.BytesIO()
+    with wave.open(content, 'wb') as wav:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(width)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype('<i{}'.format(width)).tobytes())
+    return content.getvalue()
+
+
+def make_speech(durations, sample_rate, pause=1):
+    """
+    Tones of the given durations separated by pauses.
+    """
+    parts = []
+    for duration in durations:
+        parts.append(10000 * np.sin(2 * np.pi * 440 * np.arange(int(duration * sample_rate)) / sample_rate))
+        parts.append(np.zeros(int(pause * sample_rate)))
+    return np.concatenate(parts[:-1])
+
+
+def make_flac(sample_rate, channels, total_samples):
+    info = sample_rate << 44 | (channels - 1) << 41 | 15 << 36 | total_samples
+    return b'fLaC' + b'\x80\x00\x00\x22' + b'\x00' * 10 + info.to_bytes(8, 'big') + b'\x00' * 16 + b'frames'
+
+
+def make_ogg_page(granule_position, packet):
+    return b'OggS\x00\x02' + struct.pack('<qIII', granule_position, 1, 0, 0) + bytes([1, len(packet)]) + packet
+
+
+def make_ogg_opus(input_sample_rate, duration):
+    head = b'OpusHead' + struct.pack('<BBHIhB', 1, 1, 312, input_sample_rate, 0, 0)
+    return make_ogg_page(0, head) + make_ogg_page(312 + int(duration * 48000), b'audio')
+
+
+@pytest.fixture()
+def wav_audio():
+    with io.open(os.getcwd() + '/api/speech_to_text/tests/fixtures/audio.wav', 'rb') as audio:
+        return audio.read()
+
+
+@pytest.fixture()
+def corrupted_audio():
+    with io.open(os.getcwd() + '/api/speech_to_text/tests/fixtures/corrupted.wav', 'rb') as audio:
+        return audio.read()
+
+
+# Ensure that WAV headers are read without decoding the audio
+def test_read_wav_header(wav_audio):
+    header = read_wav_header(wav_audio)
+
+    assert (header.channels, header.sample_width, header.sample_rate) == (1, 2, 44100)
+    assert header.data_offset == 44
+    assert header.data_offset + header.data_size == len(wav_audio)
+    assert round(header.duration, 2) == 3.87
+
+    # Only the beginning of the audio is needed in partial mode
+    assert read_wav_header(wav_audio[:1000], partial=True).sample_rate == 44100
+
+
+# Ensure that WAVE_FORMAT_EXTENSIBLE headers are supported
+def test_read_wav_header_extensible():
+    data = b'\x00\x00' * 16000
+    fmt = struct.pack('<HHIIHHHHI16s', 0xFFFE, 1, 16000, 32000, 2, 16, 22, 16, 4, b'\x01\x00' + b'\x00' * 14)
+    content = b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(data)) + b'WAVE' + \
+        b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(data)) + data
+    header = read_wav_header(content)
+
+    assert (header.channels, header.sample_width, header.sample_rate, header.duration) == (1, 2, 16000, 1)
+
+
+# Ensure that the samples following a header without data size (streamed or piped audio) are read
+def test_read_wav_header_unknown_size(wav_audio):
+    content = wav_audio[:40] + struct.pack('<I', 0) + wav_audio[44:]
+    header = read_wav_header(content)
+
+    assert header.data_offset + header.data_size == len(wav_audio)
+    assert round(header.duration, 2) == 3.87
+    with pytest.raises(InvalidAudioError):
+        read_wav_header(content[:44])
+
+
+# Ensure that invalid WAV headers are rejected
+def test_read_wav_header_invalid(wav_audio, corrupted_audio):
+    with pytest.raises(InvalidAudioError):
+        read_wav_header(corrupted_audio)
+    with pytest.raises(InvalidAudioError):
+        read_wav_header(wav_audio[:36])
+    with pytest.raises(InvalidAudioError):
+        read_wav_header(wav_audio[:44])
+    with pytest.raises(InvalidAudioError):
+        read_wav_header(make_wav(np.zeros((10, 1)), 4000))
+    with pytest.raises(InvalidAudioError):
+        read_wav_header(make_wav(np.zeros((10, 1)), 96000))
+    with pytest.raises(InvalidAudioError):
+        read_wav_header(wav_audio, max_duration=2)
+
+
+# Ensure that WAV audio is decoded with one column per channel
+def test_decode_wav():
+    samples = np.array([[1000, -1000], [2000, -2000], [3000, -3000]])
+    decoded, sample_rate = decode_wav(make_wav(samples, 22050))
+
+    assert sample_rate == 22050
+    assert decoded.shape == (3, 2)
+    assert np.array_equal(decoded, samples)
+    assert np.array_equal(downmix(decoded), [0, 0, 0])
+
+
+# Ensure that audio is resampled without changing its duration nor its tone
+def test_resample():
+    t = np.arange(44100) / 44100
+    samples = 10000 * np.sin(2 * np.pi * 440 * t)
+    resampled = resample(samples, 44100, 16000)
+
+    assert len(resampled) == 16000
+    spectrum = np.abs(np.fft.rfft(resampled))
+    assert abs(np.argmax(spectrum) - 440) <= 1
+
+    # Audio is never upsampled
+    assert len(resample(samples, 44100, 48000)) == 44100
+
+
+# Ensure that samples are encoded as 16 bits little-endian
+def test_encode_linear16():
+    assert encode_linear16(np.array([0, 1.4, -40000, 40000])) == b'\x00\x00\x01\x00\x00\x80\xff\x7f'
+
+
+# Ensure that the uploaded audio is converted to mono 16kHz
+def test_prepare_audio(wav_audio):
+    content, sample_rate = prepare_audio(wav_audio)
+    with wave.open(io.BytesIO(wav_audio)) as wav:
+        duration = wav.getnframes() / wav.getframerate()
+
+    assert sample_rate == 16000
+    assert len(content) / 2 <= duration * 16000
+    assert len(content) < len(wav_audio) / 2
+
+
+# Ensure that invalid audio is rejected
+def test_prepare_audio_corrupted(corrupted_audio):
+    with pytest.raises(InvalidAudioError):
+        prepare_audio(corrupted_audio)
+
+
+# Ensure that leading and trailing silence are detected
+def test_voiced_range():
+    samples = np.zeros(16000 * 3)
+    samples[16000:32000] = 10000 * np.sin(2 * np.pi * 440 * np.arange(16000) / 16000)
+    start, end = voiced_range(samples, 16000)
+
+    assert 16000 - 0.2 * 16000 - 320 <= start <= 16000 - 0.2 * 16000
+    assert 32000 + 0.2 * 16000 <= end <= 32000 + 0.2 * 16000 + 320
+
+    # Noise and clicks aren't voice
+    noise = np.random.RandomState(0).normal(0, 50, 16000 * 3)
+    noise[1000] = 30000
+    assert voiced_range(noise, 16000) is None
+
+
+# Ensure that silent audio is rejected
+def test_prepare_audio_silent():
+    with pytest.raises(SilentAudioError):
+        prepare_audio(make_wav(np.zeros((44100, 1)), 44100))
+
+
+# Ensure that FLAC headers are read
+def test_read_compressed_header_flac():
+    header = read_compressed_header(make_flac(44100, 2, 44100 * 3))
+
+    assert (header.encoding, header.channels, header.sample_rate, header.duration) == ('FLAC', 2, 44100, 3)
+    with pytest.raises(InvalidAudioError):
+        read_compressed_header(make_flac(44100, 1, 44100 * 120))
+    with pytest.raises(InvalidAudioError):
+        read_compressed_header(make_flac(96000, 1, 96000))
+
+
+# Ensure that Ogg Opus headers are read
+def test_read_compressed_header_ogg_opus():
+    header = read_compressed_header(make_ogg_opus(16000, 2))
+    assert (header.encoding, header.channels, header.sample_rate, header.duration) == ('OGG_OPUS', 1, 16000, 2)
+
+    # Opus sample rates not supported by Google are sent at 48kHz
+    assert read_compressed_header(make_ogg_opus(44100, 2)).sample_rate == 48000
+
+    with pytest.raises(InvalidAudioError):
+        read_compressed_header(make_ogg_opus(16000, 120))
+    with pytest.raises(InvalidAudioError):
+        read_compressed_header(make_ogg_page(0, b'\x01vorbis' + b'\x00' * 20))
+
+
+# Ensure that other audio isn't considered compressed
+def test_read_compressed_header_wav(wav_audio):
+    assert read_compressed_header(wav_audio) is None
+
+
+# Ensure that long audio is split at silences
+def test_split_on_silence():
+    samples = make_speech([40, 30, 20], 16000)
+    segments = split_on_silence(samples, 16000, 50)
+
+    assert len(segments) == 3
+    assert segments[0][0] == 0 and segments[-1][1] == len(samples)
+    for (start, end), (next_start, _) in zip(segments, segments[1:]):
+        assert end == next_start
+    for start, end in segments:
+        assert end - start <= 50 * 16000
+        # Cuts are in the pauses
+        assert np.all(samples[start:start + 320] == 0) or start == 0
+
+    assert split_on_silence(samples[:16000], 16000, 50) == [(0, 16000)]
+
+
+# Ensure that long audio is converted into segments without silence
+def test_prepare_audio_segments():
+    samples = make_speech([40, 30, 20], 16000)
+    samples[40 * 16000 + 16000:71 * 16000] = 0
+    segments, sample_rate = prepare_audio_segments(make_wav(samples.reshape(-1, 1), 16000))
+
+    assert sample_rate == 16000
+    # The silent segment is dropped
+    assert [round(len(segment) / 2 / 16000) for segment in segments] == [40, 20]
+
+    with pytest.raises(SilentAudioError):
+        prepare_audio_segments(make_wav(np.zeros((16000 * 90, 1)), 16000))
+    with pytest.raises(InvalidAudioError):
+        prepare_audio_segments(make_wav(samples.reshape(-1, 1), 16000), max_duration=60)
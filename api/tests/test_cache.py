@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+
+from cachetools import LRUCache
+from mock import Mock
+
+from api.cache import Cache, DiskCache, ExpiringCache, content_key, clear_all
+
+
+# Ensure that content keys only depend on their parts
+def test_content_key():
+    assert content_key('Salut', 'fr-FR_ReneeVoice') == content_key('Salut', 'fr-FR_ReneeVoice')
+    assert content_key('Salut', 'fr-FR_ReneeVoice') != content_key('Salut', 'en-US_AllisonVoice')
+    assert content_key('ab', 'c') != content_key('a', 'bc')
+
+
+# Ensure that the cache evicts the least recently used values over its byte budget
+def test_cache_byte_budget():
+    cache = Cache(LRUCache(maxsize=10, getsizeof=len))
+    cache.set('a', b'1234')
+    cache.set('b', b'1234')
+    cache.get('a')
+    cache.set('c', b'1234')
+
+    assert cache.get('a') == b'1234'
+    assert cache.get('b') is None
+    assert cache.get('c') == b'1234'
+
+    # Values bigger than the whole cache are not kept
+    cache.set('d', b'12345678901')
+    assert cache.get('d') is None
+
+    clear_all()
+    assert len(cache) == 0
+
+
+# Ensure that the disk cache keeps values between instances
+def test_disk_cache(tmpdir):
+    DiskCache(str(tmpdir)).set('key', b'audio')
+
+    assert DiskCache(str(tmpdir)).get('key') == b'audio'
+    assert DiskCache(str(tmpdir)).get('unknown') is None
+
+
+# Ensure that expiring values are reloaded, served stale while refreshed, then dropped
+def test_expiring_cache():
+    now = [0]
+    refreshed = threading.Event()
+    loader = Mock(return_value=('value', 10))
+    cache = ExpiringCache(maxsize=10, stale=5, timer=lambda: now[0])
+
+    assert cache.get_or_load('key', loader) == 'value'
+    assert cache.get_or_load('key', loader) == 'value'
+    assert loader.call_count == 1
+
+    # Stale: the old value is served while it is refreshed in the background
+    now[0] = 12
+    loader.side_effect = lambda: refreshed.set() or ('new value', 10)
+    assert cache.get_or_load('key', loader) == 'value'
+    assert refreshed.wait(1)
+    for _ in range(100):
+        if cache.get_or_load('key', loader) == 'new value':
+            break
+        time.sleep(0.01)
+    assert cache.get_or_load('key', loader) == 'new value'
+    assert loader.call_count == 2
+
+    # Expired: the value is loaded again
+    now[0] = 40
+    loader.side_effect = None
+    assert cache.get_or_load('key', loader) == 'value'
+    assert loader.call_count == 3
+
+
+# Ensure that values aren't kept without time-to-live
+def test_expiring_cache_no_ttl():
+    loader = Mock(return_value=('value', 0))
+    cache = ExpiringCache(maxsize=10)
+    cache.get_or_load('key', loader)
+    cache.get_or_load('key', loader)
+
+    assert loader.call_count == 2
+
+
+# Ensure that the disk cache locks keys between processes
+def test_disk_cache_lock(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    with cache.lock('key'):
+        cache.set('key', b'audio')
+
+    assert cache.get('key') == b'audio'
+
+
+# Ensure that locks don't leave a file per key
+def test_disk_cache_lock_files(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    for i in range(1000):
+        with cache.lock('key{}'.format(i)):
+            pass
+
+    assert len(os.listdir(os.path.join(str(tmpdir), '.locks'))) <= DiskCache.LOCK_STRIPES
+    assert sorted(os.listdir(str(tmpdir))) == ['.claims', '.locks']
+
+
+# Ensure that a key is claimed by a single process at once, until released or expired
+def test_disk_cache_claim(tmpdir):
+    cache = DiskCache(str(tmpdir))
+    assert cache.claim('key', 60)
+    assert not cache.claim('key', 60)
+    assert cache.claim('key', 0)
+
+    cache.release('key')
+    assert cache.claim('key', 60)
+    assert os.listdir(os.path.join(str(tmpdir), '.claims')) == ['key']
+
+
+# Ensure that the least recently used values are removed once the directory is too big
+def test_disk_cache_eviction(tmpdir):
+    cache = DiskCache(str(tmpdir), maxsize=130)
+    for i, key in enumerate(('a', 'b', 'c')):
+        cache.set(key, b'x' * 40)
+        os.utime(os.path.join(str(tmpdir), key), (i, i))
+    cache.get('a')
+    cache.set('d', b'x' * 40)
+
+    assert cache.get('a') == b'x' * 40
+    assert cache.get('b') is None
+    assert cache.get('c') is None
+    assert cache.get('d') == b'x' * 40
@@ -0,0 +1,33 @@
+from mock import patch
+
+from api.channels import ClientPool, create_channel, CHANNEL_OPTIONS
+
+
+# Ensure that clients of a pool have their own channel and are used in turn
+@patch('api.channels.create_channel', autospec=True)
+def test_client_pool(mock_create_channel):
+    mock_create_channel.side_effect = ['channel1', 'channel2', 'channel3']
+    pool = ClientPool(lambda channel: 'client-' + channel, 'target', ['scope'], 3)
+
+    assert mock_create_channel.call_count == 3
+    assert pool.channels == ['channel1', 'channel2', 'channel3']
+    assert [pool.get() for _ in range(4)] == ['client-channel1', 'client-channel2', 'client-channel3',
+                                              'client-channel1']
+    mock_create_channel.side_effect = None
+    mock_create_channel.return_value = 'channel'
+    assert ClientPool(lambda channel: 'client', 'target', size=0).get() == 'client'
+
+
+# Ensure that channels are built with the keep-alive options
+@patch('google.auth.transport.grpc.secure_authorized_channel', autospec=True)
+@patch('google.auth.default', autospec=True)
+def test_create_channel(mock_default, mock_secure_authorized_channel):
+    mock_default.return_value = ('credentials', 'project')
+    channel = create_channel('speech.googleapis.com:443', ['scope'])
+
+    mock_default.assert_called_once_with(scopes=['scope'])
+    assert channel == mock_secure_authorized_channel.return_value
+    args, kwargs = mock_secure_authorized_channel.call_args
+    assert args[0] == 'credentials' and args[2] == 'speech.googleapis.com:443'
+    assert kwargs['options'] == CHANNEL_OPTIONS
+    assert ('grpc.keepalive_time_ms', 30000) in CHANNEL_OPTIONS
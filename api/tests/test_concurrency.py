@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+from mock import Mock
+
+from api.concurrency import SingleFlight
+
+
+def count_lookups(flight):
+    """
+    Count the calls which looked their key up in flight: once done, they share the running call or are running it.
+    """
+    lock = flight._lock
+    lookups = threading.Semaphore(0)
+
+    class CountingLock:
+        def __enter__(self):
+            lock.acquire()
+
+        def __exit__(self, *exc_info):
+            lock.release()
+            lookups.release()
+
+    flight._lock = CountingLock()
+    return lookups
+
+
+def wait_lookups(lookups, count):
+    for _ in range(count):
+        assert lookups.acquire(timeout=5)
+
+
+# Ensure that concurrent identical calls share a single execution
+def test_single_flight():
+    flight = SingleFlight()
+    lookups = count_lookups(flight)
+    release = threading.Event()
+    func = Mock(side_effect=lambda: release.wait(5) and 'result')
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', func))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Every call joined the running one before it is released
+    wait_lookups(lookups, 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert func.call_count == 1
+    assert results == ['result'] * 5
+
+    # Later calls aren't coalesced with finished ones
+    flight.do('key', func)
+    assert func.call_count == 2
+
+
+# Ensure that errors are shared too
+def test_single_flight_error():
+    flight = SingleFlight()
+    lookups = count_lookups(flight)
+    release = threading.Event()
+    func = Mock(side_effect=lambda: release.wait(5) and 1 / 0)
+    errors = []
+
+    def call():
+        try:
+            flight.do('key', func)
+        except ZeroDivisionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_lookups(lookups, 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert func.call_count == 1
+    assert len(errors) == 3
+
+    with pytest.raises(ZeroDivisionError):
+        flight.do('key', lambda: 1 / 0)
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import threading
+
+from mock import Mock, patch
+
+from api import providers
+
+
+# Ensure that providers are only built on first use, once per process
+def test_get():
+    factory = Mock(side_effect=lambda: object())
+    providers.register('test', factory)
+
+    assert not providers.is_loaded('test')
+    assert factory.call_count == 0
+
+    threads = [threading.Thread(target=providers.get, args=('test',)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert providers.is_loaded('test')
+    assert factory.call_count == 1
+    assert providers.get('test') is providers.get('test')
+
+    # Reset providers are built again
+    instance = providers.get('test')
+    providers.reset('test')
+    assert providers.get('test') is not instance
+    assert factory.call_count == 2
+    providers.reset('test')
+
+
+# Ensure that importing the helpers neither builds any provider nor imports the heavy libraries
+def test_lazy_helpers():
+    script = """
+import sys
+import api.converse.helpers
+import api.nlp.recast.helpers
+import api.speech_to_text.google.helpers
+import api.text_to_speech.ibm.helpers
+from api import providers
+
+for module in ('google.cloud.speech', 'timezonefinder'):
+    assert module not in sys.modules, module
+for name in ('google_speech', 'timezone_finder', 'ibm_credentials', 'recast_credentials'):
+    assert name in providers.FACTORIES, name
+    assert not providers.is_loaded(name), name
+"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    res = subprocess.run([sys.executable, '-c', script], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert res.returncode == 0, res.stdout.decode()
+
+
+# Ensure that instances built by a parent process aren't used after a fork
+def test_get_after_fork():
+    providers.register('test', lambda: object())
+    instance = providers.get('test')
+
+    with patch('os.getpid', return_value=providers.pid + 1):
+        assert not providers.is_loaded('test')
+        assert providers.get('test') is not instance
+    providers.reset('test')
@@ -0,0 +1,39 @@
+from mock import Mock
+
+from api.session import session, create_session, response_ttl, POOL_CONNECTIONS, POOL_MAXSIZE
+
+
+# Ensure that every upstream helper shares the same pooled session
+def test_session_is_shared():
+    import api.converse.helpers
+    import api.nlp.recast.helpers
+    import api.text_to_speech.ibm.helpers
+
+    assert api.converse.helpers.session is session
+    assert api.nlp.recast.helpers.session is session
+    assert api.text_to_speech.ibm.helpers.session is session
+
+
+# Ensure that the session keeps a keep-alive pool per host
+def test_session_pool_configuration():
+    new_session = create_session()
+    adapter = new_session.get_adapter('https://api.recast.ai')
+
+    assert adapter is new_session.get_adapter('http://services.local')
+    assert adapter._pool_connections == POOL_CONNECTIONS
+    assert adapter._pool_maxsize == POOL_MAXSIZE
+
+
+# Ensure that the time-to-live of responses follows their caching headers
+def test_response_ttl():
+    assert response_ttl(Mock(headers={}), 60) == 60
+    assert response_ttl(Mock(headers={'Cache-Control': 'public, max-age=120'}), 60) == 120
+    assert response_ttl(Mock(headers={'Cache-Control': 'max-age=120, s-maxage=30'}), 60) == 30
+    assert response_ttl(Mock(headers={'Cache-Control': 'max-age=120', 'Age': '100'}), 60) == 20
+    assert response_ttl(Mock(headers={'Cache-Control': 'no-cache'}), 60) == 0
+    assert response_ttl(Mock(headers={'Cache-Control': 'no-store, max-age=120'}), 60) == 0
+    assert response_ttl(Mock(headers={
+        'Date': 'Wed, 01 Aug 2018 13:00:00 GMT',
+        'Expires': 'Wed, 01 Aug 2018 13:05:00 GMT'
+    }), 60) == 300
+    assert response_ttl(Mock(headers={'Expires': '0'}), 60) == 0
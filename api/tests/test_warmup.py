@@ -0,0 +1,66 @@
+import json
+import threading
+
+from flask import url_for
+from mock import patch, Mock
+
+from api import warmup
+
+
+# Ensure that the worker is ready once every warm-up step ran, even failed ones
+def test_warm_up():
+    failed_step = Mock(__name__='failed_step', side_effect=Exception('unavailable'))
+    steps = (Mock(__name__='first_step'), failed_step, Mock(__name__='last_step'))
+    warmup.ready.clear()
+    with patch.object(warmup, 'WARMUP_STEPS', steps):
+        warmup.warm_up()
+
+    for step in steps:
+        assert step.call_count == 1
+    assert warmup.ready.is_set()
+    warmup.ready.clear()
+
+
+# Ensure that a slow step doesn't hold the warm-up, and that gunicorn is notified before each step
+@patch.object(warmup, 'WARMUP_STEP_TIMEOUT', 0.01)
+def test_warm_up_slow_step():
+    release = threading.Event()
+    slow_step = Mock(__name__='slow_step', side_effect=lambda: release.wait(5))
+    last_step = Mock(__name__='last_step')
+    notify = Mock()
+    warmup.ready.clear()
+    try:
+        with patch.object(warmup, 'WARMUP_STEPS', (slow_step, last_step)):
+            warmup.warm_up(notify)
+
+        assert warmup.ready.is_set()
+        assert last_step.call_count == 1
+        assert notify.call_count == 2
+    finally:
+        release.set()
+        warmup.ready.clear()
+
+
+# Ensure that upstream connections are opened in the shared session
+@patch('api.warmup.session')
+@patch('api.warmup.providers.get', return_value={'url': 'https://ibm'})
+def test_open_connections(mock_get, mock_session):
+    warmup.open_connections()
+
+    urls = [call[0][0] for call in mock_session.head.call_args_list]
+    assert 'https://api.recast.ai' in urls and 'https://ibm' in urls
+    assert mock_session.head.call_count == 3
+
+
+# Ensure that /ready only answers 200 once the worker is warm
+def test_ready(client):
+    warmup.ready.clear()
+    res = client.get(url_for('readiness'))
+    assert res.status_code == 503
+    assert json.loads(res.data) == {'ready': False}
+
+    warmup.ready.set()
+    res = client.get(url_for('readiness'))
+    assert res.status_code == 200
+    assert json.loads(res.data) == {'ready': True}
+    warmup.ready.clear()
@@ -9,3 +9,5 @@ LANGUAGES_CODE_MAPPING = {
     'en-US': 'en-US_AllisonVoice',
     'fr-FR': 'fr-FR_ReneeVoice'
 }
+
+AUDIO_FORMAT = 'audio/wav'
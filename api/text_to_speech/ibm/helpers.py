@@ -1,30 +1,138 @@
-import requests
 import os
 import json
+import time
 
+from cachetools import LRUCache
+
+from api import providers
+from api.cache import Cache, DiskCache, content_key
+from api.concurrency import SingleFlight
 from api.exceptions import ExternalAPIException, InvalidCredentialsException
-from api.text_to_speech.ibm.constants import LANGUAGES_CODE_MAPPING as LANG_MAP, DEFAULT_LANGUAGE
+from api.session import session
+from api.text_to_speech.ibm.constants import LANGUAGES_CODE_MAPPING as LANG_MAP, DEFAULT_LANGUAGE, AUDIO_FORMAT
+
+providers.register('ibm_credentials', lambda: providers.load_credentials('ibm'))
+
+# In-memory audio cache, bounded by the total size of the stored audio (in bytes)
+TTS_CACHE_SIZE = int(os.environ.get('TTS_CACHE_SIZE', str(64 * 1024 * 1024)))
+# Optional on-disk audio cache, shared by every worker
+TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR')
+TTS_CACHE_DIR_SIZE = int(os.environ.get('TTS_CACHE_DIR_SIZE', str(512 * 1024 * 1024)))
+
+# Longest wait for IBM Watson, for the connection and each read, in seconds
+TTS_TIMEOUT = float(os.environ.get('TTS_TIMEOUT', '10'))
+
+# Size of the audio chunks forwarded to the client when streaming
+TTS_STREAM_CHUNK_SIZE = int(os.environ.get('TTS_STREAM_CHUNK_SIZE', '4096'))
+# Longest streamed audio kept aside to be cached, longer ones are only forwarded
+TTS_STREAM_CACHE_LIMIT = int(os.environ.get('TTS_STREAM_CACHE_LIMIT', str(1024 * 1024)))
+
+audio_cache = Cache(LRUCache(maxsize=TTS_CACHE_SIZE, getsizeof=len))
+audio_disk_cache = DiskCache(TTS_CACHE_DIR, TTS_CACHE_DIR_SIZE) if TTS_CACHE_DIR else None
+synthesis_flight = SingleFlight()
+
+
+def normalize_text(text):
+    return ' '.join(text.split())
 
-with open(os.getcwd() + '/res/credentials/ibm.json', 'r') as file:
-    IBM_CREDENTIALS = json.load(file)
 
+def ibm_send_request(text, language, stream=False, timeout=None):
+    """
+    Synthesize the text with IBM Watson.
+    When stream is set and the audio isn't cached yet, returns a generator of the audio chunks as they arrive.
+    timeout bounds the connection to IBM and each read from it, in seconds, it defaults to TTS_TIMEOUT.
+    """
+    if timeout is None:
+        timeout = TTS_TIMEOUT
+    text = normalize_text(text)
+    voice = LANG_MAP.get(language, DEFAULT_LANGUAGE)
+    key = content_key(text, voice, AUDIO_FORMAT)
 
-def ibm_send_request(text, language):
-    url = IBM_CREDENTIALS['url'] + '/v1/synthesize?voice={}'.format(LANG_MAP.get(language, DEFAULT_LANGUAGE))
+    content = get_cached_audio(key)
+    if content is not None:
+        return content
+    if stream:
+        return synthesize(text, voice, key, stream=True, timeout=timeout)
+    # Concurrent requests of the same audio share a single synthesis
+    return synthesis_flight.do(key, synthesize_once, text, voice, key, timeout)
+
+
+def get_cached_audio(key):
+    content = audio_cache.get(key)
+    if content is None and audio_disk_cache:
+        content = audio_disk_cache.get(key)
+        if content is not None:
+            audio_cache.set(key, content)
+    return content
+
+
+def synthesize_once(text, voice, key, timeout):
+    if audio_disk_cache is None:
+        return synthesize(text, voice, key, timeout=timeout)
+    # Other workers may be synthesizing the same audio: wait for their result, up to timeout.
+    # No lock is held during the synthesis, so a hung one only delays the requests of the same audio
+    deadline = time.monotonic() + timeout
+    claimed = audio_disk_cache.claim(key, timeout)
+    while not claimed and time.monotonic() < deadline:
+        time.sleep(audio_disk_cache.POLL_INTERVAL)
+        content = get_cached_audio(key)
+        if content is not None:
+            return content
+        claimed = audio_disk_cache.claim(key, timeout)
+    try:
+        content = get_cached_audio(key)
+        if content is not None:
+            return content
+        return synthesize(text, voice, key, timeout=timeout)
+    finally:
+        if claimed:
+            audio_disk_cache.release(key)
+
+
+def synthesize(text, voice, key, stream=False, timeout=TTS_TIMEOUT):
+    credentials = providers.get('ibm_credentials')
+    url = credentials['url'] + '/v1/synthesize?voice={}'.format(voice)
     data = json.dumps({
         'text': text
     })
     headers = {
         'Content-Type': 'application/json',
-        'Accept': 'audio/wav'
+        'Accept': AUDIO_FORMAT
     }
-    auth = (IBM_CREDENTIALS['username'], IBM_CREDENTIALS['password'])
+    auth = (credentials['username'], credentials['password'])
 
-    res = requests.post(url=url, data=data, headers=headers, auth=auth)
+    res = session.post(url=url, data=data, headers=headers, auth=auth, stream=stream, timeout=timeout)
 
-    if res.status_code == 200:
+    if res.status_code == 200 and stream:
+        return stream_audio(res, key)
+    elif res.status_code == 200:
+        audio_cache.set(key, res.content)
+        if audio_disk_cache:
+            audio_disk_cache.set(key, res.content)
         return res.content
     elif res.status_code == 401:
         raise InvalidCredentialsException(api_name='IBM')
     else:
         raise ExternalAPIException(api_name='IBM')
+
+
+def stream_audio(res, key):
+    chunks = []
+    size = 0
+    try:
+        for chunk in res.iter_content(chunk_size=TTS_STREAM_CHUNK_SIZE):
+            if chunks is not None:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > TTS_STREAM_CACHE_LIMIT:
+                    chunks = None
+            yield chunk
+    finally:
+        res.close()
+    if chunks is None:
+        return
+    # Only complete audio is cached
+    content = b''.join(chunks)
+    audio_cache.set(key, content)
+    if audio_disk_cache:
+        audio_disk_cache.set(key, content)
@@ -1,8 +1,10 @@
 import pytest
 from mock import patch, Mock
 
-from api.text_to_speech.ibm.helpers import ibm_send_request
-from api.text_to_speech.ibm.helpers import requests
+from api.exceptions import ExternalAPIException
+from api.cache import DiskCache
+from api.text_to_speech.ibm.helpers import ibm_send_request, audio_cache, TTS_TIMEOUT
+from api.session import session
 
 
 @pytest.mark.externalapi
@@ -12,10 +14,80 @@ def test_service_available(ibm_request):
 
 
 # Ensure that TTS send information
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_helper_available(mock_post, ibm_request):
     mock_post.return_value = Mock(status_code=200, content='mock')
     res = ibm_send_request(ibm_request['text'], ibm_request['language'])
 
     assert res == 'mock'
-    assert mock_post.call_count == 1
\ No newline at end of file
+    assert mock_post.call_count == 1
+    assert mock_post.call_args[1]['timeout'] == TTS_TIMEOUT
+
+
+# Ensure that TTS doesn't synthesize the same text twice
+@patch.object(session, 'post', autospec=True)
+def test_helper_cache(mock_post, ibm_request):
+    mock_post.return_value = Mock(status_code=200, content=b'mock')
+    res = ibm_send_request(ibm_request['text'], ibm_request['language'])
+    res_cached = ibm_send_request('  {} '.format(ibm_request['text']), ibm_request['language'])
+
+    assert res == res_cached == b'mock'
+    assert mock_post.call_count == 1
+
+    ibm_send_request(ibm_request['text'], 'en-US')
+    assert mock_post.call_count == 2
+
+
+# Ensure that TTS doesn't cache upstream errors
+@patch.object(session, 'post', autospec=True)
+def test_helper_cache_error(mock_post, ibm_request):
+    mock_post.return_value = Mock(status_code=500)
+    with pytest.raises(ExternalAPIException):
+        ibm_send_request(ibm_request['text'], ibm_request['language'])
+    with pytest.raises(ExternalAPIException):
+        ibm_send_request(ibm_request['text'], ibm_request['language'])
+
+    assert mock_post.call_count == 2
+
+
+# Ensure that TTS forwards the audio chunks as they arrive when streaming
+@patch.object(session, 'post', autospec=True)
+def test_helper_stream(mock_post, ibm_request):
+    mock_post.return_value = Mock(status_code=200, iter_content=Mock(return_value=iter([b'RIFF', b'data'])))
+    res = ibm_send_request(ibm_request['text'], ibm_request['language'], stream=True)
+
+    assert list(res) == [b'RIFF', b'data']
+    assert mock_post.call_args[1]['stream']
+    assert mock_post.return_value.close.call_count == 1
+
+    # Complete streamed audio is cached
+    assert ibm_send_request(ibm_request['text'], ibm_request['language'], stream=True) == b'RIFFdata'
+    assert mock_post.call_count == 1
+
+
+# Ensure that TTS shares the audio synthesized by other workers through the disk cache
+@patch.object(session, 'post', autospec=True)
+def test_helper_disk_cache(mock_post, ibm_request, tmpdir):
+    mock_post.return_value = Mock(status_code=200, content=b'mock')
+    with patch('api.text_to_speech.ibm.helpers.audio_disk_cache', DiskCache(str(tmpdir))):
+        ibm_send_request(ibm_request['text'], ibm_request['language'])
+        audio_cache.clear()
+        res = ibm_send_request(ibm_request['text'], ibm_request['language'])
+
+    assert res == b'mock'
+    assert mock_post.call_count == 1
+
+
+# Ensure that TTS doesn't wait longer than the timeout for the synthesis of another worker
+@patch.object(session, 'post', autospec=True)
+def test_helper_disk_cache_claimed(mock_post, ibm_request, tmpdir):
+    mock_post.return_value = Mock(status_code=200, content=b'mock')
+    disk_cache = DiskCache(str(tmpdir))
+    # Claim every key, as a worker hung while synthesizing would
+    disk_cache.claim = Mock(return_value=False)
+    with patch('api.text_to_speech.ibm.helpers.audio_disk_cache', disk_cache):
+        res = ibm_send_request(ibm_request['text'], ibm_request['language'], timeout=0.1)
+
+    assert res == b'mock'
+    assert mock_post.call_count == 1
+    assert disk_cache.claim.call_count > 1
@@ -4,7 +4,7 @@ from flask import url_for
 
 from api.exceptions import BadParameterException, MissingParameterException, InvalidCredentialsException, ExternalAPIException, APIException
 from api.text_to_speech.ibm.constants import LANGUAGES_CODE
-from api.text_to_speech.ibm.helpers import requests
+from api.session import session
 
 
 # Ensure that TTS behaves correctly when provided correct information
@@ -23,6 +23,26 @@ def test_speak_success(mock_ibm_send_request, client, ibm_request):
     assert res.status_code == 200
 
 
+# Ensure that TTS streams the audio when asked to
+@patch('api.text_to_speech.ibm.views.ibm_send_request', autospec=True)
+def test_speak_stream(mock_ibm_send_request, client, ibm_request):
+    mock_ibm_send_request.return_value = iter([b'RIFF', b'data'])
+    res = client.post(
+        url_for('tts_ibm.speak'),
+        content_type='application/json',
+        data=json.dumps({
+            'language': ibm_request['language'],
+            'text': ibm_request['text'],
+            'stream': True
+        })
+    )
+
+    assert mock_ibm_send_request.call_count == 1
+    assert mock_ibm_send_request.call_args[1]['stream']
+    assert res.status_code == 200
+    assert res.data == b'RIFFdata'
+
+
 # Ensure that TTS behaves correctly when provided bad language
 @patch('api.text_to_speech.ibm.views.ibm_send_request', autospec=True)
 def test_speak_bad_language(mock_ibm_send_request, client, ibm_request):
@@ -100,9 +120,9 @@ def test_speak_missing_text_and_language(mock_ibm_send_request, client):
 
 
 # Ensure that TTS behaves correctly when credentials are invalid
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_speak_invalid_credentials(mock_post, client, ibm_request):
-    # Mocking of requests.post()
+    # Mocking of session.post()
     mock_post.return_value = Mock(status_code=401)
 
     res = client.post(
@@ -150,7 +170,7 @@ def test_speak_ibm_not_working(mock_ibm_send_request, client, ibm_request):
 
 
 # Ensure that TTS behaves correctly when IBM respond with an error
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_speak_ibm_send_an_error(mock_post, client, ibm_request):
     mock_post.return_value = Mock(status_code=500)
     res = client.post(
@@ -174,7 +194,7 @@ def test_speak_ibm_send_an_error(mock_post, client, ibm_request):
 
 
 # Ensure that TTS behaves correctly when request can't pass
-@patch.object(requests, 'post', autospec=True)
+@patch.object(session, 'post', autospec=True)
 def test_speak_request_not_working(mock_post, client, ibm_request):
     mock_post.side_effect = Exception()
     res = client.post(
@@ -25,12 +25,13 @@ def speak():
 
     text = request.json['text']
     language = request.json['language']
+    stream = bool(request.json.get('stream'))
 
     if language not in LANGUAGES_CODE:
         return jsonify({'errors': [dict(BadParameterException('language', valid_values=LANGUAGES_CODE))]}), 400
 
     try:
-        res = ibm_send_request(text, language)
+        res = ibm_send_request(text, language, stream=stream)
     except (InvalidCredentialsException, ExternalAPIException) as e:
         return jsonify({'errors': [dict(e)]}), e.status_code
     except Exception as e:
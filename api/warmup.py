@@ -0,0 +1,73 @@
+import logging
+import os
+import threading
+
+from api import providers
+from api.session import session
+
+logger = logging.getLogger(__name__)
+
+# Longest wait for each upstream connection, in seconds
+WARMUP_TIMEOUT = float(os.environ.get('WARMUP_TIMEOUT', '5'))
+# Longest run of each warm-up step, in seconds: slower steps are left running and done by the first request needing them.
+# Must stay below GUNICORN_TIMEOUT, the worker is killed when a step holds it longer
+WARMUP_STEP_TIMEOUT = float(os.environ.get('WARMUP_STEP_TIMEOUT', '20'))
+
+# Set once the worker is warm, workers only accept requests afterwards, see /ready
+ready = threading.Event()
+
+
+def warm_up(notify=None):
+    """
+    Get the worker ready for its first requests: open the upstream connections, load the heavy data
+    and render the fallback audio. Failed steps are logged, they are then done by the first request needing them.
+    notify() is called before each step, so gunicorn doesn't take the worker for a hung one.
+    """
+    for step in WARMUP_STEPS:
+        if notify:
+            notify()
+        run_step(step)
+    ready.set()
+
+
+def run_step(step):
+    errors = []
+
+    def target():
+        try:
+            step()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target, name='warm-up-{}'.format(step.__name__), daemon=True)
+    thread.start()
+    thread.join(WARMUP_STEP_TIMEOUT)
+    if thread.is_alive():
+        logger.error('Warm-up {} timed out after {}s'.format(step.__name__, WARMUP_STEP_TIMEOUT))
+    elif errors:
+        logger.error('Warm-up {} failed: {}'.format(step.__name__, errors[0]))
+
+
+def open_connections():
+    from api.converse.helpers import services_url
+    # Connections are kept in the session pool, TLS handshakes are done by then
+    for url in ('https://api.recast.ai', providers.get('ibm_credentials')['url'], services_url):
+        session.head(url, timeout=WARMUP_TIMEOUT)
+
+
+def connect_speech():
+    providers.get('google_speech').connect(WARMUP_TIMEOUT)
+
+
+def load_timezones():
+    from api.converse.helpers import get_timezone
+    get_timezone(48.86, 2.35)
+
+
+def render_fallback_audio():
+    # Not needed to answer: the worker doesn't wait for it
+    from api.converse.helpers import render_custom_messages_in_background
+    render_custom_messages_in_background()
+
+
+WARMUP_STEPS = (open_connections, connect_speech, load_timezones, render_fallback_audio)
@@ -5,5 +5,7 @@ import os
 load_dotenv(find_dotenv())
 
 from api.server import app
+from api.warmup import warm_up
 
+warm_up()
 app.run(debug=int(os.environ.get('DEBUG', '0')))
@@ -0,0 +1,33 @@
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+
+# A converse turn spends almost all its time waiting on Google, Recast, IBM or the services API:
+# each worker keeps many of them in flight with a pool of threads instead of serving one at a time.
+worker_class = 'gthread'
+# Exported so the upstream connection pools are sized to the number of threads
+threads = int(os.environ.setdefault('GUNICORN_THREADS', '32'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+# Importing the app once in the master shares its memory between workers,
+# provider clients are still built by each worker after the fork
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true')
+
+
+def post_fork(server, worker):
+    from api import providers
+    providers.reset()
+
+
+def post_worker_init(worker):
+    # Workers share the listening socket: the worker only starts accepting requests once warm,
+    # each warm-up step being bounded by WARMUP_STEP_TIMEOUT
+    from api.warmup import warm_up
+    warm_up(worker.notify)
+
+
+def worker_exit(server, worker):
+    # Memory changes are written to Recast in the background: don't lose the pending ones
+    from api.nlp.recast.helpers import memory_store
+    memory_store.flush_all()